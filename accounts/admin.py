@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, TwoFactorCode
+from .models import CustomUser, TwoFactorCode, OutboundEmail, WalletTransaction
 
 
 @admin.register(CustomUser)
@@ -14,6 +14,8 @@ class CustomUserAdmin(UserAdmin):
 
     list_editable = ('is_staff',)
 
+    readonly_fields = ('wallet_balance',)
+
     ordering = ('username',)
 
     fieldsets = (
@@ -40,4 +42,28 @@ class TwoFactorCodeAdmin(admin.ModelAdmin):
     def is_valid(self, obj):
         return obj.is_valid()
     is_valid.boolean = True 
-    is_valid.short_description = 'معتبر؟'
\ No newline at end of file
+    is_valid.short_description = 'معتبر؟'
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to', 'subject')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+
+
+# The ledger is append-only and written by accounts.wallet, so it is read-only here.
+@admin.register(WalletTransaction)
+class WalletTransactionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'amount', 'balance_after', 'kind', 'reference', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('user__username', 'reference')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
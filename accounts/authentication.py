@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+from rest_framework.authentication import BaseAuthentication, BasicAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from .models import CustomUser
+from .throttling import LoginIPThrottle, LoginUsernameThrottle
+from .tokens import ACCESS, TokenError, decode, token_user
+
+
+# `Authorization: Bearer <access token>` (see accounts.tokens). request.auth is the
+# token payload.
+class SignedTokenAuthentication(BaseAuthentication):
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("هدر احراز هویت نامعتبر است")
+        try:
+            payload = decode(auth[1].decode(), ACCESS)
+        except (TokenError, UnicodeError) as e:
+            raise AuthenticationFailed(str(e) if isinstance(e, TokenError) else "توکن نامعتبر است")
+        return token_user(payload), payload
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+# Basic auth that doesn't hash the password on every request. Verified credentials
+# are remembered (keyed by an HMAC of username and password) for
+# BASIC_AUTH_CACHE_TTL together with the stored password hash, so a password
+# change invalidates them. Attempts that do need hashing spend from the login
+# throttle buckets.
+class ThrottledBasicAuthentication(BasicAuthentication):
+    def authenticate_credentials(self, userid, password, request=None):
+        cache = caches[settings.THROTTLE_CACHE]
+        key = 'auth:basic:' + salted_hmac('accounts.basic', f'{userid}\0{password}').hexdigest()
+        verified = cache.get(key)
+        if verified:
+            user = CustomUser.objects.filter(pk=verified[0], is_active=True).first()
+            if user and user.password == verified[1]:
+                return user, None
+
+        ip_throttle, username_throttle = LoginIPThrottle(), LoginUsernameThrottle()
+        for throttle, ident in ((ip_throttle, ip_throttle.get_ident(request)), (username_throttle, userid.lower())):
+            if not throttle.consume(throttle.bucket_key(ident)):
+                raise Throttled(throttle.wait())
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(key, (user.pk, user.password), settings.BASIC_AUTH_CACHE_TTL)
+        return user, auth
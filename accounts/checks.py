@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# State every worker process must see the same way can't live in a per-process
+# cache: a token revoked in one worker would stay valid in the others, a 2FA code
+# would be checked by a worker that never saw the login, and each worker would
+# allow the whole throttle rate on its own.
+
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+CACHED_SESSION_ENGINES = ('django.contrib.sessions.backends.cache', 'django.contrib.sessions.backends.cached_db')
+
+
+def is_local(alias):
+    return settings.CACHES[alias]['BACKEND'] in LOCAL_BACKENDS
+
+
+@register()
+def shared_caches(app_configs, **kwargs):
+    errors = []
+    if is_local(settings.TOKEN_REVOCATION_CACHE):
+        errors.append(Error(
+            f"TOKEN_REVOCATION_CACHE ('{settings.TOKEN_REVOCATION_CACHE}') is a local-memory cache.",
+            hint="Point it at a cache shared by all processes, e.g. the 'shared' alias.",
+            id='accounts.E001',
+        ))
+    if is_local(settings.PENDING_LOGIN_CACHE):
+        errors.append(Error(
+            f"PENDING_LOGIN_CACHE ('{settings.PENDING_LOGIN_CACHE}') is a local-memory cache.",
+            hint="Point it at a cache shared by all processes, e.g. the 'shared' alias.",
+            id='accounts.E002',
+        ))
+    if is_local(settings.THROTTLE_CACHE):
+        errors.append(Error(
+            f"THROTTLE_CACHE ('{settings.THROTTLE_CACHE}') is a local-memory cache.",
+            hint="Point it at a cache shared by all processes, e.g. the 'shared' alias.",
+            id='accounts.E004',
+        ))
+    # The LRU engine on a local cache would keep serving a logged-out session in
+    # every other process; Django's cache engines there only lose sessions.
+    if settings.SESSION_ENGINE == 'accounts.sessions' and is_local(settings.SESSION_CACHE_ALIAS):
+        errors.append(Error(
+            f"SESSION_ENGINE 'accounts.sessions' needs a shared SESSION_CACHE_ALIAS, "
+            f"not the local-memory '{settings.SESSION_CACHE_ALIAS}'.",
+            hint="Set SESSION_CACHE_ALIAS to a shared cache (e.g. Redis) or use the database engine.",
+            id='accounts.E003',
+        ))
+    elif settings.SESSION_ENGINE in CACHED_SESSION_ENGINES and is_local(settings.SESSION_CACHE_ALIAS):
+        errors.append(Warning(
+            f"SESSION_ENGINE '{settings.SESSION_ENGINE}' uses the local-memory cache "
+            f"'{settings.SESSION_CACHE_ALIAS}', which other processes don't see.",
+            hint="Set SESSION_CACHE_ALIAS to a shared cache when running several processes.",
+            id='accounts.W001',
+        ))
+    return errors
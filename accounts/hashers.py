@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+# Password hashers whose cost comes from settings (PASSWORD_ARGON2_PARAMS,
+# PASSWORD_SCRYPT_PARAMS). Changing a parameter makes must_update() true for old
+# hashes, so Django rehashes them at the user's next successful login.
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_PARAMS['time_cost']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_PARAMS['memory_cost']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARAMS['parallelism']
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_PARAMS['work_factor']
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_PARAMS['block_size']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARAMS['parallelism']
+
+    # hashlib's default 32 MiB limit is too small for larger work factors.
+    @property
+    def maxmem(self):
+        return 256 * self.work_factor * self.block_size * self.parallelism
@@ -0,0 +1,71 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from accounts.models import CustomUser, TwoFactorCode
+
+ENGINES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'accounts.sessions',
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.signed_cookies',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec of the login -> 2FA verify -> profile flow across session engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--profile-requests', type=int, default=10, help='Profile reads per login')
+        parser.add_argument('--engine', action='append', dest='engines', help='Session engine to test (repeatable)')
+        parser.add_argument('--real-hasher', action='store_true',
+                            help='Keep PASSWORD_HASHERS (by default a cheap hasher keeps login from dominating)')
+
+    def handle(self, *args, **options):
+        # Throttle buckets go to a dummy cache, so repeated logins of one user aren't rejected.
+        caches = {**settings.CACHES, 'benchmark-throttle': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        overrides = {'ALLOWED_HOSTS': ['*'], 'EMAIL_OUTBOX_WORKERS': 0, 'CACHES': caches,
+                     'THROTTLE_CACHE': 'benchmark-throttle'}
+        if not options['real_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(**overrides):
+            user = CustomUser.objects.filter(username='auth-bench').first() or CustomUser(
+                username='auth-bench', email='auth-bench@example.com', mobile_number='auth-bench')
+            user.set_password('bench-pass-1234')
+            user.save()
+            self.stdout.write(f"{'engine':<50} {'login/s':>8} {'verify/s':>9} {'profile/s':>10} {'flows/s':>8}")
+            for engine in options['engines'] or ENGINES:
+                with override_settings(SESSION_ENGINE=engine):
+                    self.stdout.write(self.run_engine(engine, user, options))
+
+    def run_engine(self, engine, user, options):
+        timings = {'login': 0.0, 'verify': 0.0, 'profile': 0.0}
+        for i in range(options['iterations'] + 1):
+            client = Client()
+            phase = {}
+            started = time.perf_counter()
+            assert client.post('/api/accounts/login/', {'username': user.username, 'password': 'bench-pass-1234'},
+                               content_type='application/json').status_code == 200
+            phase['login'] = time.perf_counter() - started
+
+            code = TwoFactorCode.objects.filter(user=user).latest('created_at').code
+            started = time.perf_counter()
+            assert client.post('/api/accounts/two-factor-verify/', {'code': code},
+                               content_type='application/json').status_code == 200
+            phase['verify'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(options['profile_requests']):
+                assert client.get('/api/accounts/profile/').status_code == 200
+            phase['profile'] = time.perf_counter() - started
+            client.post('/api/accounts/logout/')
+            if i:  # the first round warms up imports and connections
+                for key, value in phase.items():
+                    timings[key] += value
+
+        n = options['iterations']
+        flow = sum(timings.values())
+        return (f"{engine:<50} {n / timings['login']:8.1f} {n / timings['verify']:9.1f} "
+                f"{n * options['profile_requests'] / timings['profile']:10.1f} {n / flow:8.1f}")
@@ -0,0 +1,63 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from accounts import pending
+from accounts.models import CustomUser, TwoFactorCode
+from accounts.serializers import TwoFactorCodeSerializer
+
+
+class Command(BaseCommand):
+    help = 'Grow the 2FA code table in steps and report verify latency at each size (run against a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Codes added in total')
+        parser.add_argument('--steps', type=int, default=4)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=200, help='Verifications timed per step')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        users = self.seed_users(options['users'])
+        per_step = options['rows'] // options['steps']
+        for _ in range(options['steps']):
+            self.seed_codes(rng, users, per_step)
+            timings = []
+            for _ in range(options['repeat']):
+                user_id = rng.choice(users)
+                code = f'{rng.randrange(10 ** 6):06d}'
+                TwoFactorCode.objects.create(user_id=user_id, code=code)
+                request = SimpleNamespace(data={'login_token': pending.start(SimpleNamespace(pk=user_id))}, COOKIES={})
+                started = time.perf_counter()
+                serializer = TwoFactorCodeSerializer(data={'code': code}, context={'request': request})
+                assert serializer.is_valid(), serializer.errors
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'{TwoFactorCode.objects.count():>10} codes   verify median {statistics.median(timings):6.2f} ms'
+                              f'   p95 {p95:6.2f} ms')
+
+    def seed_users(self, count):
+        existing = CustomUser.objects.filter(username__startswith='2fa-bench-').count()
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'2fa-bench-{i}', email=f'2fa-bench-{i}@example.com', mobile_number=f'2fa{i:09d}',
+                       password='!')
+            for i in range(existing, count)
+        ])
+        return list(CustomUser.objects.filter(username__startswith='2fa-bench-').values_list('pk', flat=True)[:count])
+
+    # Mostly expired codes, as left behind by logins that were never completed.
+    def seed_codes(self, rng, users, count, batch_size=5000):
+        now = timezone.now()
+        for start in range(0, count, batch_size):
+            TwoFactorCode.objects.bulk_create([
+                TwoFactorCode(user_id=rng.choice(users), code=f'{rng.randrange(10 ** 6):06d}',
+                              expires_at=now - timedelta(minutes=rng.randint(-10, 60 * 24 * 30)))
+                for _ in range(min(batch_size, count - start))
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE accounts_twofactorcode')
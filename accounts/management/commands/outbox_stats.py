@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from accounts.outbox import outbox_stats
+
+
+class Command(BaseCommand):
+    help = 'Show email outbox queue depth, delivery counters and average send latency'
+
+    def handle(self, *args, **options):
+        stats = outbox_stats()
+        self.stdout.write(f"pending: {stats['pending']} (due {stats['due']}, oldest {stats['oldest_pending_seconds']:.0f}s)  "
+                          f"failed: {stats['failed']}")
+        self.stdout.write(f"sent: {stats['sent']}  send failures: {stats['send_failures']}  "
+                          f"avg send: {stats['avg_send_ms']:.1f} ms")
@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import OutboundEmail, PasswordResetToken, TwoFactorCode
+
+
+class Command(BaseCommand):
+    help = 'Delete expired 2FA codes and password reset tokens (and old sent outbox mail) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--outbox-days', type=int, default=7, help='Keep sent/failed outbox mail this many days')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        purges = [
+            ('2FA codes', TwoFactorCode.objects.filter(expires_at__lte=now)),
+            ('password reset tokens', PasswordResetToken.objects.filter(expires_at__lte=now)),
+            ('outbox messages', OutboundEmail.objects.exclude(status=OutboundEmail.PENDING)
+                                .filter(created_at__lte=now - timedelta(days=options['outbox_days']))),
+        ]
+        for label, queryset in purges:
+            deleted = self.purge(queryset, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{deleted} expired {label} deleted'))
+
+    # Short pk-batched DELETEs keep locks and WAL bursts small on large tables.
+    def purge(self, queryset, batch_size):
+        deleted = 0
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from accounts.wallet import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Reset cached wallet balances to the sum of the wallet ledger where they drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{fixed} wallet balances corrected'))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver due outbox emails in batches (once, or continuously with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for due messages')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        delivered = 0
+        while True:
+            claimed = deliver_batch(options['batch_size'])
+            delivered += claimed
+            if claimed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'{delivered} messages processed'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 09:30
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0004_outboundemail'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='passwordresettoken',
+            index=models.Index(fields=['expires_at'], name='reset_token_expires_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='twofactorcode',
+            index=models.Index(fields=['user', 'code', 'expires_at'], name='twofactor_user_code_exp_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='twofactorcode',
+            index=models.Index(fields=['expires_at'], name='twofactor_expires_at_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_auth_expiry_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('kind', models.CharField(choices=[('deposit', 'واریز'), ('purchase', 'خرید'), ('refund', 'بازگشت وجه'), ('adjustment', 'اصلاح')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='wallet_tx_user_created_idx')],
+            },
+        ),
+        # Existing balances become opening entries, so the ledger sums to them.
+        migrations.RunSQL(
+            """
+            INSERT INTO accounts_wallettransaction (user_id, amount, balance_after, kind, reference, created_at)
+            SELECT id, wallet_balance, wallet_balance, 'adjustment', 'opening balance', NOW()
+            FROM accounts_customuser WHERE wallet_balance <> 0
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
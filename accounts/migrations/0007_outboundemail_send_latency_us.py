@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_wallettransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='send_latency_us',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 14:35
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+# The 'shared' cache (token revocations) defaults to a database table; create it
+# here so a plain `migrate` leaves every process able to use it.
+def create_cache_tables(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_outboundemail_send_latency_us'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
@@ -15,11 +15,40 @@ class CustomUser(AbstractUser):
     profile_picture = models.ImageField(upload_to='profiles/', null=True, blank=True)
     job = models.CharField(max_length=100, blank=True)
     invite_code = models.CharField(max_length=10, unique=True, blank=True, null=True)
+    # Cached sum of the user's WalletTransaction ledger; only changed through accounts.wallet.
     wallet_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
 
+    # wallet_balance is only changed by accounts.wallet's F() updates, so saving an
+    # existing user (profile edits, password resets, the admin) must not write back
+    # a stale copy. Deferred fields are left alone, as Django's own save does, and so
+    # are fields a token user still holds as copied from its token (`token_claims`,
+    # set by accounts.tokens): the token may predate a change to them.
+    counter_fields = ('wallet_balance',)
+    token_claims = {}
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.attname not in deferred
+                                       and field.name not in self.counter_fields
+                                       and not self.holds_token_claim(field.attname)]
+        super().save(*args, **kwargs)
+
+    def holds_token_claim(self, attname):
+        return attname in self.token_claims and getattr(self, attname) == self.token_claims[attname]
+
     def __str__(self):
         return self.username
 
+    # Token-authenticated users are built with most fields deferred (accounts.tokens);
+    # touching one deferred field loads all of them in a single query.
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
 # Two-factor authentication code model :
 class TwoFactorCode(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='two_factor_codes')
@@ -35,9 +64,21 @@ class TwoFactorCode(models.Model):
     def is_valid(self):
         return self.expires_at > timezone.now()
 
+    # Checks and spends a code in one indexed DELETE; returns whether a live code matched.
+    @classmethod
+    def consume(cls, user_id, code):
+        deleted, _ = cls.objects.filter(user_id=user_id, code=code, expires_at__gt=timezone.now()).delete()
+        return deleted > 0
+
     def __str__(self):
         return f"Code {self.code} for {self.user.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'code', 'expires_at'], name='twofactor_user_code_exp_idx'),
+            models.Index(fields=['expires_at'], name='twofactor_expires_at_idx'),
+        ]
+
 # Password reset token model : 
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='reset_tokens')
@@ -54,4 +95,73 @@ class PasswordResetToken(models.Model):
         return self.expires_at > timezone.now()
 
     def __str__(self):
-        return f"Reset token for {self.user.username}"
\ No newline at end of file
+        return f"Reset token for {self.user.username}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='reset_token_expires_at_idx'),
+        ]
+
+# Outgoing email persisted in the request's transaction and delivered later by
+# accounts.outbox (background workers or the send_queued_mail command).
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'در صف'),
+        (SENT, 'ارسال شده'),
+        (FAILED, 'ناموفق'),
+    )
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    send_latency_us = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
+
+    class Meta:
+        indexes = [
+            # Workers only ever scan due pending messages.
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'), name='outbound_email_due_idx'),
+        ]
+
+
+# Append-only wallet ledger. Every change of CustomUser.wallet_balance is recorded
+# here by accounts.wallet, in the same transaction as the balance update.
+class WalletTransaction(models.Model):
+    KIND_CHOICES = (
+        ('deposit', 'واریز'),
+        ('purchase', 'خرید'),
+        ('refund', 'بازگشت وجه'),
+        ('adjustment', 'اصلاح'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='wallet_transactions')
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Wallet transactions are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.amount} ({self.kind}) for {self.user.username}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='wallet_tx_user_created_idx'),
+        ]
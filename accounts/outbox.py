@@ -0,0 +1,143 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, Min, Q, Sum
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+# Requests only insert an OutboundEmail row; delivery happens after commit on a
+# small in-process thread pool (EMAIL_OUTBOX_WORKERS, 0 disables it) and in the
+# send_queued_mail command, which also picks up retries. Workers claim due rows
+# with SKIP LOCKED, so any number of them can run side by side.
+
+_executor = None
+
+
+def enqueue(to, subject, body, from_email=None):
+    email = OutboundEmail.objects.create(
+        to=to, subject=subject, body=body, from_email=from_email or settings.DEFAULT_FROM_EMAIL
+    )
+    transaction.on_commit(kick)
+    return email
+
+
+def kick():
+    global _executor
+    workers = settings.EMAIL_OUTBOX_WORKERS
+    if not workers:
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+    _executor.submit(drain)
+
+
+# Delivers batches until nothing is due. Runs on pool threads, which own their
+# database connections.
+def drain():
+    close_old_connections()
+    try:
+        while deliver_batch():
+            pass
+    finally:
+        close_old_connections()
+
+
+def retry_delay(attempts):
+    return min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+
+
+# Sends up to `batch_size` due messages over one backend connection and returns how
+# many were claimed. Failed messages are retried with exponential backoff until
+# EMAIL_OUTBOX_MAX_ATTEMPTS, then marked failed.
+def deliver_batch(batch_size=None):
+    emails = claim(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            record_failure(email, e)
+    else:
+        try:
+            for email in emails:
+                send(email, connection)
+        finally:
+            connection.close()
+    OutboundEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at', 'send_latency_us']
+    )
+    return len(emails)
+
+
+# Claims due messages in a short transaction by pushing next_attempt_at past the
+# lease (EMAIL_OUTBOX_LEASE), so SMTP runs without a row lock or open transaction
+# and other workers skip the batch. A worker that dies mid-batch leaves its
+# messages to be retried once the lease runs out.
+def claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+        )
+    return emails
+
+
+def send(email, connection):
+    message = EmailMessage(email.subject, email.body, email.from_email, [email.to], connection=connection)
+    started = time.perf_counter()
+    try:
+        message.send()
+    except Exception as e:
+        record_failure(email, e)
+        return
+    email.status = OutboundEmail.SENT
+    email.attempts += 1
+    email.sent_at = timezone.now()
+    email.send_latency_us = int((time.perf_counter() - started) * 1_000_000)
+    email.last_error = ''
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)[:1000]
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboundEmail.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(email.attempts))
+
+
+# Everything comes from the table, so any process reports the same numbers:
+# every attempt but a message's successful one was a failure. Counters cover the
+# rows purge_expired_auth hasn't deleted yet.
+def outbox_stats():
+    now = timezone.now()
+    stats = OutboundEmail.objects.aggregate(
+        pending=Count('pk', filter=Q(status=OutboundEmail.PENDING)),
+        due=Count('pk', filter=Q(status=OutboundEmail.PENDING, next_attempt_at__lte=now)),
+        failed=Count('pk', filter=Q(status=OutboundEmail.FAILED)),
+        oldest=Min('created_at', filter=Q(status=OutboundEmail.PENDING)),
+        sent=Count('pk', filter=Q(status=OutboundEmail.SENT)),
+        attempts=Sum('attempts'),
+        latency_us=Avg('send_latency_us'),
+    )
+    oldest = stats.pop('oldest')
+    attempts = stats.pop('attempts') or 0
+    latency_us = stats.pop('latency_us')
+    return {
+        **stats,
+        'oldest_pending_seconds': (now - oldest).total_seconds() if oldest else 0,
+        'send_failures': attempts - stats['sent'],
+        'avg_send_ms': latency_us / 1000 if latency_us else 0,
+    }
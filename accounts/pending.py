@@ -0,0 +1,34 @@
+import secrets
+from collections.abc import Mapping
+from django.conf import settings
+from django.core.cache import caches
+
+# Logins waiting for their 2FA code. The state lives in a cache under an opaque
+# login token (returned to the client and set as a cookie) rather than in the
+# session, so starting a login writes no session row.
+
+COOKIE_NAME = 'login_token'
+
+
+def pending_cache():
+    return caches[settings.PENDING_LOGIN_CACHE]
+
+
+def start(user):
+    token = secrets.token_urlsafe(32)
+    pending_cache().set(f'auth:pending:{token}', user.pk, int(settings.PENDING_LOGIN_TTL.total_seconds()))
+    return token
+
+
+def user_id(token):
+    return pending_cache().get(f'auth:pending:{token}') if token else None
+
+
+def finish(token):
+    pending_cache().delete(f'auth:pending:{token}')
+
+
+# The token comes from the request body (mobile clients) or the cookie (browsers).
+def token_from(request):
+    body = request.data if isinstance(request.data, Mapping) else {}
+    return body.get('login_token') or request.COOKIES.get(COOKIE_NAME)
@@ -0,0 +1,6 @@
+from pulse_shop.renditions import register
+from .models import CustomUser
+
+# Profile pictures get renditions like catalog images (see pulse_shop.renditions).
+
+register(CustomUser, 'profile_picture')
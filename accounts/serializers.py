@@ -1,8 +1,10 @@
 from rest_framework import serializers
-from .models import CustomUser, TwoFactorCode, PasswordResetToken
+from .models import CustomUser, TwoFactorCode, PasswordResetToken, WalletTransaction
 from django.contrib.auth import authenticate
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
+from .outbox import enqueue
+from . import pending
+from pulse_shop.renditions import RenditionsField
 import random
 import string
 
@@ -37,47 +39,43 @@ class LoginSerializer(serializers.Serializer):
         user = authenticate(**data)
         if user and user.is_active:
             code = ''.join(random.choices(string.digits, k=6))
-            TwoFactorCode.objects.create(user=user, code=code)
-            try:
-                send_mail(
+            with transaction.atomic():
+                TwoFactorCode.objects.create(user=user, code=code)
+                enqueue(
+                    to=user.email,
                     subject='کد تأیید دو مرحله‌ای',
-                    message=f'سلام {user.first_name}،\n\nکد تأیید شما: {code}\nاین کد تا 10 دقیقه معتبر است.',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
+                    body=f'سلام {user.first_name}،\n\nکد تأیید شما: {code}\nاین کد تا 10 دقیقه معتبر است.',
                 )
-            except Exception as e:
-                raise serializers.ValidationError(f"خطا در ارسال ایمیل: {str(e)}")
             return user
         raise serializers.ValidationError("نام کاربری یا رمز عبور اشتباه است")
 
-# This serializer is used for verifying the two-factor authentication code :
+# This serializer is used for verifying the two-factor authentication code.
+# The code is checked and consumed by one DELETE (see TwoFactorCode.consume) :
 class TwoFactorCodeSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=6)
 
     def validate(self, data):
-        code = data.get('code')
-        user_id = self.context['request'].session.get('pending_user_id')
+        user_id = pending.user_id(pending.token_from(self.context['request']))
         if not user_id:
             raise serializers.ValidationError("جلسه ورود نامعتبر است")
-        
-        try:
-            user = CustomUser.objects.get(id=user_id)
-            two_factor_code = TwoFactorCode.objects.filter(user=user, code=code).latest('created_at')
-            if not two_factor_code.is_valid():
-                raise serializers.ValidationError("کد منقضی شده است")
-            return data
-        except CustomUser.DoesNotExist:
+        if not TwoFactorCode.consume(user_id, data['code']):
+            raise serializers.ValidationError("کد نامعتبر یا منقضی شده است")
+        user = CustomUser.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
             raise serializers.ValidationError("کاربر یافت نشد")
-        except TwoFactorCode.DoesNotExist:
-            raise serializers.ValidationError("کد نامعتبر است")
+        return user
 
 # This serializer is used for updating user profile :
 class UserProfileSerializer(serializers.HyperlinkedModelSerializer):
+    profile_picture_renditions = RenditionsField(source='profile_picture')
+
     class Meta:
         model = CustomUser
         fields = ['url', 'id', 'username', 'email', 'first_name', 'last_name', 'mobile_number', 
-                  'birth_date', 'national_code', 'profile_picture', 'job', 'invite_code', 'wallet_balance']
+                  'birth_date', 'national_code', 'profile_picture', 'profile_picture_renditions', 'job', 'invite_code',
+                  'wallet_balance']
+        # The balance only changes through accounts.wallet.
+        read_only_fields = ['wallet_balance']
         extra_kwargs = {
             'url': {'view_name': 'customuser-detail', 'lookup_field': 'pk'}
         }
@@ -105,4 +103,16 @@ class PasswordResetSerializer(serializers.Serializer):
                 raise serializers.ValidationError("توکن منقضی شده است")
             return data
         except PasswordResetToken.DoesNotExist:
-            raise serializers.ValidationError("توکن نامعتبر است")
\ No newline at end of file
+            raise serializers.ValidationError("توکن نامعتبر است")
+
+# This serializer is used for refreshing or revoking API tokens :
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+
+# This serializer is used for listing wallet ledger entries :
+class WalletTransactionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WalletTransaction
+        fields = ['id', 'amount', 'balance_after', 'kind', 'reference', 'created_at']
+        read_only_fields = fields
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+# Opt-in session engine for SESSION_ENGINE = 'accounts.sessions': Django's cached_db store
+# (shared cache in front of django_session) with a small per-process LRU in front of
+# the shared cache. Reads of a hot session cost no network round trip at all.
+# Writes and deletes go through to every layer, but another process may serve
+# its own LRU copy for up to SESSION_LOCAL_CACHE_TTL seconds (e.g. after a logout),
+# and the shared cache must really be shared (see accounts.checks).
+
+class LocalLRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return dict(data)
+
+    def set(self, key, data):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, dict(data))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_sessions = LocalLRU(settings.SESSION_LOCAL_CACHE_SIZE, settings.SESSION_LOCAL_CACHE_TTL)
+
+
+class SessionStore(CachedDBStore):
+    def load(self):
+        data = local_sessions.get(self.session_key) if self.session_key else None
+        if data is None:
+            data = super().load()
+            if data and self.session_key:
+                local_sessions.set(self.session_key, data)
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        local_sessions.set(self.session_key, self._session)
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key:
+            local_sessions.delete(key)
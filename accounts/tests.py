@@ -1,3 +1,478 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+import base64
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+from django.contrib.sessions.models import Session
+from . import checks, outbox, pending, tokens, wallet
+from .sessions import LocalLRU, SessionStore, local_sessions
+from .authentication import SignedTokenAuthentication
+from .models import CustomUser, OutboundEmail, PasswordResetToken, TwoFactorCode, WalletTransaction
 
-# Create your tests here.
+
+def make_user(username, **extra):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com',
+                                          mobile_number=f'0912{CustomUser.objects.count():07d}',
+                                          password='pass1234', **extra)
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali')
+
+    def test_login_queues_the_code_instead_of_sending_it(self):
+        response = self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(outbox.deliver_batch(), 1)
+        code = TwoFactorCode.objects.get(user=self.user).code
+        self.assertEqual(mail.outbox[0].to, ['ali@example.com'])
+        self.assertIn(code, mail.outbox[0].body)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+    def test_password_reset_is_queued(self):
+        response = self.client.post('/api/accounts/password-reset/', {'email': 'ali@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        call_command('send_queued_mail', stdout=StringIO())
+        self.assertIn(str(self.user.reset_tokens.get().token), mail.outbox[0].body)
+
+    def test_batch_shares_one_connection(self):
+        for i in range(3):
+            outbox.enqueue(f'user{i}@example.com', 'Hello', 'Body')
+        with mock.patch('accounts.outbox.get_connection', wraps=outbox.get_connection) as get_connection:
+            self.assertEqual(outbox.deliver_batch(batch_size=2), 2)
+            self.assertEqual(outbox.deliver_batch(batch_size=2), 1)
+        self.assertEqual(get_connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        email = outbox.enqueue('ali@example.com', 'Hello', 'Body')
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=SMTPException('down')):
+            outbox.deliver_batch()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), (OutboundEmail.PENDING, 1, 'down'))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertEqual(outbox.deliver_batch(), 0)
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+            outbox.deliver_batch()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 2))
+        self.assertEqual(outbox.outbox_stats()['send_failures'], 2)
+
+    def test_stats_report_queue_depth_and_latency(self):
+        outbox.enqueue('a@example.com', 'Hello', 'Body')
+        outbox.enqueue('b@example.com', 'Hello', 'Body')
+        OutboundEmail.objects.filter(to='b@example.com').update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        outbox.deliver_batch()
+        stats = outbox.outbox_stats()
+        self.assertEqual((stats['pending'], stats['due'], stats['sent']), (1, 0, 1))
+        self.assertGreater(stats['avg_send_ms'], 0)
+
+    def test_claimed_messages_are_leased(self):
+        email = outbox.enqueue('ali@example.com', 'Hello', 'Body')
+        self.assertEqual(outbox.claim(10), [email])
+        self.assertEqual(outbox.claim(10), [])
+        email.refresh_from_db()
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(minutes=10))
+
+
+class OutboxWorkerTests(TransactionTestCase):
+    @override_settings(EMAIL_OUTBOX_WORKERS=1)
+    def test_committed_messages_are_delivered_by_the_pool(self):
+        outbox.enqueue('ali@example.com', 'Hello', 'Body')
+        outbox._executor.shutdown(wait=True)
+        outbox._executor = None
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+    @override_settings(EMAIL_OUTBOX_WORKERS=0)
+    def test_messages_are_sent_outside_a_transaction(self):
+        outbox.enqueue('ali@example.com', 'Hello', 'Body')
+        in_transaction = []
+        with mock.patch('django.core.mail.EmailMessage.send',
+                        side_effect=lambda: in_transaction.append(connection.in_atomic_block)):
+            self.assertEqual(outbox.deliver_batch(), 1)
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+
+class TwoFactorVerifyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali')
+        self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'})
+        self.code = TwoFactorCode.objects.get(user=self.user).code
+
+    def verify(self, code):
+        return self.client.post('/api/accounts/two-factor-verify/', {'code': code})
+
+    def test_code_is_consumed_by_one_statement(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(TwoFactorCode.consume(self.user.pk, self.code))
+        self.assertFalse(TwoFactorCode.objects.exists())
+        self.assertFalse(TwoFactorCode.consume(self.user.pk, self.code))
+
+    def test_verify_logs_in_once(self):
+        response = self.verify(self.code)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/accounts/profile/').data['username'], 'ali')
+        self.assertEqual(self.verify(self.code).status_code, 400)
+
+    def test_expired_and_wrong_codes_are_rejected(self):
+        TwoFactorCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify(self.code).status_code, 400)
+        self.assertEqual(self.verify('000000' if self.code != '000000' else '111111').status_code, 400)
+        self.assertEqual(TwoFactorCode.objects.count(), 1)
+
+    def test_purge_deletes_only_expired_rows(self):
+        TwoFactorCode.objects.create(user=self.user, code='123456', expires_at=timezone.now() - timedelta(minutes=1))
+        PasswordResetToken.objects.create(user=self.user, expires_at=timezone.now() - timedelta(minutes=1))
+        live_token = PasswordResetToken.objects.create(user=self.user)
+        call_command('purge_expired_auth', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(TwoFactorCode.objects.values_list('code', flat=True)), [self.code])
+        self.assertEqual(list(PasswordResetToken.objects.all()), [live_token])
+
+
+class BenchmarkTwoFactorCommandTests(TestCase):
+    def test_reports_latency_per_table_size(self):
+        out = StringIO()
+        call_command('benchmark_two_factor', rows=40, steps=2, users=3, repeat=2, stdout=out)
+        self.assertEqual(out.getvalue().count('verify median'), 2)
+
+
+class SignedTokenTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali', first_name='Ali')
+        self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'})
+        code = TwoFactorCode.objects.get(user=self.user).code
+        self.pair = self.client.post('/api/accounts/two-factor-verify/', {'code': code}).data
+        self.client.logout()
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_access_token_is_verified_without_loading_the_user(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.pair["access"]}')
+        with self.assertNumQueries(0):
+            user, payload = SignedTokenAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'ali', False))
+        with self.assertNumQueries(1):
+            self.assertEqual((user.first_name, user.email), ('Ali', 'ali@example.com'))
+
+    def test_bearer_token_authenticates_api_requests(self):
+        self.bearer(self.pair['access'])
+        self.assertEqual(self.client.get('/api/accounts/profile/').data['first_name'], 'Ali')
+        self.bearer(self.pair['access'][:-2] + 'xx')
+        response = self.client.get('/api/accounts/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_expired_access_token_is_rejected(self):
+        with override_settings(TOKEN_ACCESS_TTL=timedelta(seconds=-1)):
+            self.bearer(tokens.encode(self.user, tokens.ACCESS))
+        self.assertEqual(self.client.get('/api/accounts/profile/').status_code, 401)
+
+    def test_refresh_rotates_the_pair(self):
+        response = self.client.post('/api/accounts/token/refresh/', {'refresh': self.pair['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['access'], self.pair['access'])
+        again = self.client.post('/api/accounts/token/refresh/', {'refresh': self.pair['refresh']})
+        self.assertEqual(again.status_code, 401)
+        self.assertEqual(self.client.post('/api/accounts/token/refresh/', {'refresh': self.pair['access']}).status_code, 401)
+
+    def test_profile_update_keeps_flags_changed_after_the_token_was_issued(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True, is_active=False)
+        self.bearer(self.pair['access'])
+        self.client.put('/api/accounts/profile/', {'first_name': 'Reza', 'username': 'reza'})
+        self.assertEqual(CustomUser.objects.filter(pk=self.user.pk).values_list('first_name', 'username', 'is_staff', 'is_active').get(),
+                         ('Reza', 'reza', True, False))
+
+    def test_logout_revokes_the_refresh_token(self):
+        self.bearer(self.pair['access'])
+        self.assertEqual(self.client.post('/api/accounts/logout/', {'refresh': self.pair['refresh']}).status_code, 200)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/accounts/token/refresh/', {'refresh': self.pair['refresh']}).status_code, 401)
+
+    def test_password_reset_revokes_every_refresh_token(self):
+        token = PasswordResetToken.objects.create(user=self.user)
+        # The reset happens a second after the tokens were issued.
+        with mock.patch('accounts.tokens.time.time', return_value=tokens.decode(self.pair['refresh'], tokens.REFRESH)['iat'] + 1):
+            self.client.post('/api/accounts/password-reset-confirm/', {'token': token.token, 'new_password': 'new-pass-1234'})
+        self.assertEqual(self.client.post('/api/accounts/token/refresh/', {'refresh': self.pair['refresh']}).status_code, 401)
+
+    def test_revocations_are_visible_to_other_processes(self):
+        payload = tokens.decode(self.pair['access'], tokens.ACCESS)
+        tokens.revoke(payload)
+        # A fresh backend instance stands in for another worker's cache connection.
+        other = caches.create_connection(settings.TOKEN_REVOCATION_CACHE)
+        self.assertTrue(other.has_key(f'auth:revoked:{payload["jti"]}'))
+
+    def test_local_revocation_cache_is_rejected(self):
+        with override_settings(TOKEN_REVOCATION_CACHE='default'):
+            self.assertEqual([error.id for error in checks.shared_caches(None)], ['accounts.E001'])
+        self.assertEqual(checks.shared_caches(None), [])
+
+    def test_lru_sessions_need_a_shared_cache(self):
+        with override_settings(SESSION_ENGINE='accounts.sessions', SESSION_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in checks.shared_caches(None)], ['accounts.E003'])
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', SESSION_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in checks.shared_caches(None)], ['accounts.W001'])
+        with override_settings(SESSION_ENGINE='accounts.sessions', SESSION_CACHE_ALIAS='shared'):
+            self.assertEqual(checks.shared_caches(None), [])
+
+
+class PendingLoginTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali')
+
+    def test_login_keeps_pending_state_out_of_the_session(self):
+        response = self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'})
+        self.assertEqual(pending.user_id(response.data['login_token']), self.user.pk)
+        self.assertEqual(response.cookies[pending.COOKIE_NAME].value, response.data['login_token'])
+        self.assertFalse(Session.objects.exists())
+        # Another worker's cache connection sees the pending login too.
+        other = caches.create_connection(settings.PENDING_LOGIN_CACHE)
+        self.assertEqual(other.get(f'auth:pending:{response.data["login_token"]}'), self.user.pk)
+
+    def test_mobile_client_verifies_with_the_body_token(self):
+        login_token = self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'}).data['login_token']
+        self.client.cookies.clear()
+        code = TwoFactorCode.objects.get(user=self.user).code
+        response = self.client.post('/api/accounts/two-factor-verify/', {'code': code, 'login_token': login_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(pending.user_id(login_token))
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_sessions.clear()
+
+    def test_hot_sessions_are_read_from_the_local_lru(self):
+        session = SessionStore()
+        session['cart'] = 3
+        session.save()
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(session.session_key)['cart'], 3)
+
+        SessionStore(session.session_key).delete()
+        self.assertIsNone(local_sessions.get(session.session_key))
+        self.assertNotIn('cart', SessionStore(session.session_key))
+
+    def test_lru_evicts_oldest_and_expired_entries(self):
+        lru = LocalLRU(maxsize=2, ttl=60)
+        lru.set('a', {'n': 1})
+        lru.set('b', {'n': 2})
+        lru.get('a')
+        lru.set('c', {'n': 3})
+        self.assertEqual((lru.get('a'), lru.get('b')), ({'n': 1}, None))
+        lru.ttl = -1
+        lru.set('d', {'n': 4})
+        self.assertIsNone(lru.get('d'))
+
+
+class BenchmarkAuthFlowCommandTests(TestCase):
+    def test_reports_every_engine(self):
+        out = StringIO()
+        call_command('benchmark_auth_flow', iterations=1, profile_requests=1,
+                     engines=['accounts.sessions', 'django.contrib.sessions.backends.signed_cookies'], stdout=out)
+        self.assertIn('signed_cookies', out.getvalue())
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class LoginThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali')
+
+    def login(self, username='ali', password='wrong-pass'):
+        return self.client.post('/api/accounts/login/', {'username': username, 'password': password})
+
+    def test_username_bucket_rejects_before_hashing(self):
+        with mock.patch('accounts.serializers.authenticate', return_value=None) as authenticate:
+            statuses = [self.login().status_code for _ in range(6)]
+        self.assertEqual(statuses, [400] * 5 + [429])
+        self.assertEqual(authenticate.call_count, 5)
+        self.assertEqual(self.login(username='other').status_code, 400)
+
+    def test_ip_bucket_covers_many_usernames(self):
+        with mock.patch('accounts.serializers.authenticate', return_value=None):
+            statuses = [self.login(username=f'user{i}').status_code for i in range(21)]
+        self.assertEqual(statuses[-2:], [400, 429])
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch('accounts.serializers.authenticate', return_value=None), \
+                mock.patch('accounts.throttling.TokenBucketThrottle.timer', return_value=1000.0) as timer:
+            for _ in range(5):
+                self.login()
+            self.assertEqual(self.login().status_code, 429)
+            timer.return_value = 1012.5  # one token per 12 s at 5/min
+            self.assertEqual(self.login().status_code, 400)
+            self.assertEqual(self.login().status_code, 429)
+
+    def test_two_factor_guesses_are_limited_per_pending_login(self):
+        self.login(password='pass1234')
+        code = TwoFactorCode.objects.get(user=self.user).code
+        wrong = '000000' if code != '000000' else '111111'
+        for _ in range(5):
+            self.client.post('/api/accounts/two-factor-verify/', {'code': wrong})
+        self.assertEqual(self.client.post('/api/accounts/two-factor-verify/', {'code': code}).status_code, 429)
+
+    def test_password_reset_is_limited_per_email(self):
+        statuses = [self.client.post('/api/accounts/password-reset/', {'email': 'ali@example.com'}).status_code
+                    for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_local_throttle_cache_is_rejected(self):
+        with override_settings(THROTTLE_CACHE='default'):
+            self.assertEqual([error.id for error in checks.shared_caches(None)], ['accounts.E004'])
+
+    def test_non_object_bodies_are_rejected_not_crashed(self):
+        for url in ('/api/accounts/login/', '/api/accounts/two-factor-verify/', '/api/accounts/password-reset/'):
+            self.assertEqual(self.client.post(url, [], format='json').status_code, 400, url)
+
+    def test_forwarded_for_header_does_not_pick_the_bucket(self):
+        with mock.patch('accounts.serializers.authenticate', return_value=None):
+            statuses = [self.client.post('/api/accounts/login/', {'username': f'user{i}', 'password': 'x'},
+                                         HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code for i in range(21)]
+        self.assertEqual(statuses[-2:], [400, 429])
+
+
+class BasicAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('ali')
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'ali:pass1234').decode())
+
+    def test_verified_credentials_skip_hashing(self):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as check:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/api/accounts/profile/').status_code, 200)
+        self.assertEqual(check.call_count, 1)
+
+    def test_password_change_invalidates_remembered_credentials(self):
+        self.client.get('/api/accounts/profile/')
+        self.user.set_password('new-pass-1234')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/accounts/profile/').status_code, 401)
+
+    def test_failed_attempts_are_throttled(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'ali:wrong').decode())
+        statuses = [self.client.get('/api/accounts/profile/').status_code for _ in range(6)]
+        self.assertEqual(statuses, [401] * 5 + [429])
+
+
+class PasswordHasherTests(TestCase):
+    def test_new_hashes_use_the_tuned_preferred_hasher(self):
+        encoded = make_password('pass1234')
+        self.assertEqual(identify_hasher(encoded).algorithm, get_hasher('default').algorithm)
+        self.assertFalse(get_hasher('default').must_update(encoded))
+
+    def test_old_hashes_are_upgraded_at_login(self):
+        user = make_user('ali')
+        CustomUser.objects.filter(pk=user.pk).update(password=make_password('pass1234', hasher='pbkdf2_sha256'))
+        cache.clear()
+        self.client.post('/api/accounts/login/', {'username': 'ali', 'password': 'pass1234'})
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, get_hasher('default').algorithm)
+
+    @override_settings(PASSWORD_SCRYPT_PARAMS={'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1})
+    def test_changed_cost_marks_hashes_for_upgrade(self):
+        encoded = make_password('pass1234', hasher='scrypt')
+        with override_settings(PASSWORD_SCRYPT_PARAMS={'work_factor': 2 ** 15, 'block_size': 8, 'parallelism': 1}):
+            self.assertTrue(get_hasher('scrypt').must_update(encoded))
+
+
+class WalletTests(APITestCase):
+    def setUp(self):
+        self.user = make_user('ali')
+        self.client.force_authenticate(self.user)
+
+    def test_credit_and_debit_write_the_ledger(self):
+        wallet.credit(self.user, '100.00')
+        entry = wallet.debit(self.user, 30, reference='order 7')
+        self.assertEqual((entry.amount, entry.balance_after, entry.kind), (Decimal('-30'), Decimal('70'), 'purchase'))
+        self.assertEqual(self.client.get('/api/accounts/wallet/').data, {'balance': Decimal('70.00')})
+        rows = self.client.get('/api/accounts/wallet/transactions/').data['results']
+        self.assertEqual([row['amount'] for row in rows], ['-30.00', '100.00'])
+
+    def test_debit_never_goes_negative(self):
+        wallet.credit(self.user, 10)
+        with self.assertRaises(wallet.WalletError):
+            wallet.debit(self.user, '10.01')
+        with self.assertRaises(wallet.WalletError):
+            wallet.credit(self.user, 0)
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_profile_update_cannot_change_the_balance(self):
+        self.client.put('/api/accounts/profile/', {'wallet_balance': '1000000', 'job': 'dev'})
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.wallet_balance, self.user.job), (0, 'dev'))
+
+    def test_profile_update_keeps_a_concurrent_credit(self):
+        # request.user was loaded before the credit landed.
+        wallet.credit(CustomUser.objects.get(pk=self.user.pk), 50)
+        self.assertEqual(self.client.put('/api/accounts/profile/', {'job': 'dev'}).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.wallet_balance, self.user.job), (50, 'dev'))
+        self.user.set_password('new-pass-1234')
+        self.user.wallet_balance = 0
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.wallet_balance, 50)
+
+    def test_reconcile_fixes_only_drifted_balances(self):
+        other = make_user('sara')
+        wallet.credit(self.user, 50)
+        wallet.credit(other, 20)
+        CustomUser.objects.filter(pk=self.user.pk).update(wallet_balance=999)
+        out = StringIO()
+        call_command('reconcile_wallets', batch_size=1, stdout=out)
+        self.assertIn('1 wallet balances corrected', out.getvalue())
+        self.assertEqual(sorted(CustomUser.objects.values_list('wallet_balance', flat=True)), [20, 50])
+
+
+class ConcurrentWalletTests(TransactionTestCase):
+    def test_parallel_debits_neither_lose_updates_nor_overdraw(self):
+        user = make_user('ali')
+        wallet.credit(user, 100)
+        errors = []
+
+        def spend():
+            try:
+                wallet.debit(user, 10)
+            except wallet.WalletError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=spend) for _ in range(25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        user.refresh_from_db()
+        self.assertEqual(user.wallet_balance, 0)
+        self.assertEqual(len(errors), 15)
+        self.assertEqual(WalletTransaction.objects.filter(kind='purchase').count(), 10)
+        self.assertEqual(sorted(WalletTransaction.objects.values_list('balance_after', flat=True)),
+                         [Decimal(n) for n in range(0, 101, 10)])
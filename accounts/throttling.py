@@ -0,0 +1,90 @@
+from collections.abc import Mapping
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+from . import pending
+
+
+# Token bucket over DRF rate strings: a '5/min' bucket holds 5 tokens and refills
+# one every 12 s, so bursts are bounded and steady traffic isn't locked out for a
+# whole window. Throttles run before the view, so rejected attempts never reach
+# password hashing. Buckets are read-modify-written in the shared THROTTLE_CACHE;
+# racing requests can overdraw a bucket by a token or two.
+class TokenBucketThrottle(SimpleRateThrottle):
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        return self.consume(self.get_cache_key(request, view))
+
+    def consume(self, key):
+        if key is None:
+            return True
+        refill = self.num_requests / self.duration
+        now = self.timer()
+        tokens, updated = self.cache.get(key, (self.num_requests, now))
+        tokens = min(self.num_requests, tokens + (now - updated) * refill)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill
+            return False
+        self.cache.set(key, (tokens - 1, now), self.duration)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+    def bucket_key(self, ident):
+        return f'throttle:{self.scope}:{ident}'
+
+
+class IPThrottle(TokenBucketThrottle):
+    def get_cache_key(self, request, view):
+        return self.bucket_key(self.get_ident(request))
+
+
+# Keyed by a request field (username, email...), case-insensitively. A body that
+# isn't an object (e.g. a JSON array) has no fields; the view rejects it.
+class FieldThrottle(TokenBucketThrottle):
+    field = None
+
+    def get_value(self, request):
+        return request.data.get(self.field) if isinstance(request.data, Mapping) else None
+
+    def get_cache_key(self, request, view):
+        value = self.get_value(request)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return self.bucket_key(value.strip().lower())
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class LoginUsernameThrottle(FieldThrottle):
+    scope = 'login_username'
+    field = 'username'
+
+
+class TwoFactorIPThrottle(IPThrottle):
+    scope = 'two_factor_ip'
+
+
+# Attempts per pending login, which bounds guessing of a 6-digit code.
+class TwoFactorThrottle(FieldThrottle):
+    scope = 'two_factor'
+
+    def get_value(self, request):
+        return pending.token_from(request)
+
+
+class PasswordResetIPThrottle(IPThrottle):
+    scope = 'password_reset_ip'
+
+
+class PasswordResetEmailThrottle(FieldThrottle):
+    scope = 'password_reset_email'
+    field = 'email'
@@ -0,0 +1,114 @@
+import time
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from .models import CustomUser
+
+# Stateless bearer tokens for API clients, signed with SECRET_KEY (HMAC-SHA256).
+# Access tokens carry what request.user needs for permission checks, so verifying
+# one is a signature check: no query, no cache lookup, the user isn't loaded. They
+# can't be revoked and stay valid until they expire (TOKEN_ACCESS_TTL, short).
+# Refresh tokens are checked against the shared revocation list and are single
+# use: refreshing revokes the old one.
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class TokenError(Exception):
+    pass
+
+
+def revocation_cache():
+    return caches[settings.TOKEN_REVOCATION_CACHE]
+
+
+def lifetime(kind):
+    return settings.TOKEN_ACCESS_TTL if kind == ACCESS else settings.TOKEN_REFRESH_TTL
+
+
+def encode(user, kind):
+    now = int(time.time())
+    payload = {
+        'uid': user.pk,
+        'usr': user.username,
+        'stf': user.is_staff,
+        'sup': user.is_superuser,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + int(lifetime(kind).total_seconds()),
+    }
+    return signing.dumps(payload, salt=f'accounts.tokens.{kind}', compress=True)
+
+
+def issue_pair(user):
+    return {
+        'access': encode(user, ACCESS),
+        'refresh': encode(user, REFRESH),
+        'expires_in': int(settings.TOKEN_ACCESS_TTL.total_seconds()),
+    }
+
+
+def decode(token, kind):
+    try:
+        payload = signing.loads(token, salt=f'accounts.tokens.{kind}')
+    except signing.BadSignature:
+        raise TokenError("توکن نامعتبر است")
+    if payload['exp'] <= time.time():
+        raise TokenError("توکن منقضی شده است")
+    if kind == REFRESH and is_revoked(payload):
+        raise TokenError("توکن باطل شده است")
+    return payload
+
+
+# The revocation list only holds jtis of unexpired tokens (entries expire with the
+# token), plus a per-user cutoff that revokes every token issued before it.
+def is_revoked(payload):
+    keys = [f'auth:revoked:{payload["jti"]}', f'auth:revoked-before:{payload["uid"]}']
+    revoked = revocation_cache().get_many(keys)
+    return keys[0] in revoked or revoked.get(keys[1], 0) >= payload['iat']
+
+
+def revoke(payload):
+    remaining = int(payload['exp'] - time.time()) + 1
+    if remaining > 0:
+        revocation_cache().set(f'auth:revoked:{payload["jti"]}', 1, remaining)
+
+
+# Logout and /token/revoke/; an invalid or already revoked token is ignored.
+def revoke_refresh(token):
+    try:
+        revoke(decode(token, REFRESH))
+    except TokenError:
+        pass
+
+
+# E.g. after a password change: no outstanding refresh token of the user works
+# any more, so its sessions end within one access token lifetime.
+def revoke_all(user_id):
+    timeout = int(settings.TOKEN_REFRESH_TTL.total_seconds()) + 1
+    revocation_cache().set(f'auth:revoked-before:{user_id}', int(time.time()), timeout)
+
+
+# Exchanges a refresh token for a new pair. The user is reloaded here (not on every
+# request), so deactivation and permission changes apply at the next refresh.
+def refresh(token):
+    payload = decode(token, REFRESH)
+    user = CustomUser.objects.filter(pk=payload['uid'], is_active=True).first()
+    if user is None:
+        raise TokenError("کاربر یافت نشد")
+    revoke(payload)
+    return issue_pair(user)
+
+
+# request.user for token requests, built without a query. Other fields are
+# deferred and load together on first access (see CustomUser.refresh_from_db).
+# The claim values may be stale, so saving the user leaves them out unless changed.
+def token_user(payload):
+    values = {'id': payload['uid'], 'username': payload['usr'], 'is_staff': payload['stf'],
+              'is_superuser': payload['sup'], 'is_active': True}
+    field_names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in values]
+    user = CustomUser.from_db('default', field_names, [values[name] for name in field_names])
+    user.token_claims = values
+    return user
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (RegisterView, LoginView, LogoutView, UserProfileView, CustomUserViewSet, 
-                   TwoFactorVerifyView, PasswordResetRequestView, PasswordResetConfirmView)
+                   TwoFactorVerifyView, PasswordResetRequestView, PasswordResetConfirmView,
+                   TokenRefreshView, TokenRevokeView, WalletView, WalletTransactionViewSet)
 
 router = DefaultRouter()
 router.register(r'users', CustomUserViewSet, basename='customuser')
+router.register(r'wallet/transactions', WalletTransactionViewSet, basename='wallettransaction')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -12,7 +14,10 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('two-factor-verify/', TwoFactorVerifyView.as_view(), name='two-factor-verify'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('token/revoke/', TokenRevokeView.as_view(), name='token-revoke'),
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('wallet/', WalletView.as_view(), name='wallet'),
     path('password-reset/', PasswordResetRequestView.as_view(), name='password-reset'),
     path('password-reset-confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
 ]
\ No newline at end of file
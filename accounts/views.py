@@ -2,12 +2,17 @@ from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import CustomUser, PasswordResetToken, TwoFactorCode
+from .models import CustomUser, PasswordResetToken, TwoFactorCode, WalletTransaction
 from .serializers import (RegisterSerializer, LoginSerializer, UserProfileSerializer, 
-                         TwoFactorCodeSerializer, PasswordResetRequestSerializer, PasswordResetSerializer)
-from django.contrib.auth import login, logout
-from django.core.mail import send_mail
+                         TwoFactorCodeSerializer, PasswordResetRequestSerializer, PasswordResetSerializer,
+                         TokenRefreshSerializer, WalletTransactionSerializer)
+from .outbox import enqueue
+from . import pending, tokens
+from .throttling import (LoginIPThrottle, LoginUsernameThrottle, TwoFactorIPThrottle, TwoFactorThrottle,
+                         PasswordResetIPThrottle, PasswordResetEmailThrottle)
 from django.conf import settings
+from django.contrib.auth import login, logout
+from django.db import transaction
 
 # register : 
 class RegisterView(APIView):
@@ -20,45 +25,67 @@ class RegisterView(APIView):
 
 # Login : 
 class LoginView(APIView):
+    # No authentication: Basic auth would hash a password before the throttles run.
+    authentication_classes = []
+    throttle_classes = [LoginIPThrottle, LoginUsernameThrottle]
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.validated_data
-            request.session['pending_user_id'] = user.id
-            return Response({"message": "کد تأیید به ایمیل شما ارسال شد"}, status=status.HTTP_200_OK)
+            login_token = pending.start(serializer.validated_data)
+            response = Response({"message": "کد تأیید به ایمیل شما ارسال شد", "login_token": login_token},
+                                status=status.HTTP_200_OK)
+            response.set_cookie(pending.COOKIE_NAME, login_token, max_age=int(settings.PENDING_LOGIN_TTL.total_seconds()),
+                                httponly=True, samesite='Lax')
+            return response
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # email verification : 
 class TwoFactorVerifyView(APIView):
+    authentication_classes = []
+    throttle_classes = [TwoFactorIPThrottle, TwoFactorThrottle]
+
     def post(self, request):
-        user_id = request.session.get('pending_user_id')
-        if not user_id:
-            return Response({"error": "جلسه ورود نامعتبر است"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            user = CustomUser.objects.get(id=user_id)
-            serializer = TwoFactorCodeSerializer(data=request.data, context={'request': request})
-            if serializer.is_valid():
-                two_factor_code = TwoFactorCode.objects.filter(user=user, code=serializer.validated_data['code']).latest('created_at')
-                if not two_factor_code.is_valid():
-                    return Response({"error": "کد منقضی شده است"}, status=status.HTTP_400_BAD_REQUEST)
-                login(request, user)
-                del request.session['pending_user_id']
-                return Response({"message": "ورود با موفقیت انجام شد"}, status=status.HTTP_200_OK)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        except CustomUser.DoesNotExist:
-            return Response({"error": "کاربر یافت نشد"}, status=status.HTTP_400_BAD_REQUEST)
-        except TwoFactorCode.DoesNotExist:
-            return Response({"error": "کد نامعتبر است"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = TwoFactorCodeSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            user = serializer.validated_data
+            login(request, user)
+            pending.finish(pending.token_from(request))
+            response = Response({"message": "ورود با موفقیت انجام شد", **tokens.issue_pair(user)}, status=status.HTTP_200_OK)
+            response.delete_cookie(pending.COOKIE_NAME)
+            return response
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # logout : 
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if serializer.is_valid():
+            tokens.revoke_refresh(serializer.validated_data['refresh'])
         logout(request)
         return Response({"message": "خروج با موفقیت انجام شد"}, status=status.HTTP_200_OK)
 
+# API tokens : 
+class TokenRefreshView(APIView):
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                return Response(tokens.refresh(serializer.validated_data['refresh']), status=status.HTTP_200_OK)
+            except tokens.TokenError as e:
+                return Response({"error": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class TokenRevokeView(APIView):
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if serializer.is_valid():
+            tokens.revoke_refresh(serializer.validated_data['refresh'])
+            return Response({"message": "توکن باطل شد"}, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 # User Profile : 
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
@@ -76,23 +103,22 @@ class UserProfileView(APIView):
 
 # Password Reset Request : 
 class PasswordResetRequestView(APIView):
+    authentication_classes = []
+    throttle_classes = [PasswordResetIPThrottle, PasswordResetEmailThrottle]
+
     def post(self, request):
         serializer = PasswordResetRequestSerializer(data=request.data)
         if serializer.is_valid():
             user = CustomUser.objects.get(email=serializer.validated_data['email'])
-            token = PasswordResetToken.objects.create(user=user)
-            reset_url = f"http://127.0.0.1:8000/api/accounts/password-reset-confirm/?token={token.token}"
-            try:
-                send_mail(
+            with transaction.atomic():
+                token = PasswordResetToken.objects.create(user=user)
+                reset_url = f"http://127.0.0.1:8000/api/accounts/password-reset-confirm/?token={token.token}"
+                enqueue(
+                    to=user.email,
                     subject='بازیابی رمز عبور',
-                    message=f'سلام {user.first_name}،\n\nبرای بازیابی رمز عبور خود، روی لینک زیر کلیک کنید:\n{reset_url}\nاین لینک تا 1 ساعت معتبر است.',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
+                    body=f'سلام {user.first_name}،\n\nبرای بازیابی رمز عبور خود، روی لینک زیر کلیک کنید:\n{reset_url}\nاین لینک تا 1 ساعت معتبر است.',
                 )
-                return Response({"message": "لینک بازیابی به ایمیل شما ارسال شد"}, status=status.HTTP_200_OK)
-            except Exception as e:
-                return Response({"error": f"خطا در ارسال ایمیل: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"message": "لینک بازیابی به ایمیل شما ارسال شد"}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Password Reset Confirm :
@@ -104,6 +130,7 @@ class PasswordResetConfirmView(APIView):
             user = token.user
             user.set_password(serializer.validated_data['new_password'])
             user.save()
+            tokens.revoke_all(user.pk)
             token.delete()  # حذف توکن بعد از استفاده
             return Response({"message": "رمز عبور با موفقیت تغییر کرد"}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -112,4 +139,21 @@ class PasswordResetConfirmView(APIView):
 class CustomUserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = UserProfileSerializer
-    permission_classes = [IsAuthenticated]
\ No newline at end of file
+    permission_classes = [IsAuthenticated]
+
+# Wallet balance, read from the user row (the ledger is not summed) :
+class WalletView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        balance = CustomUser.objects.filter(pk=request.user.pk).values_list('wallet_balance', flat=True).get()
+        return Response({"balance": balance}, status=status.HTTP_200_OK)
+
+# Wallet ledger, newest first :
+class WalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = WalletTransactionSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = '-created_at'
+
+    def get_queryset(self):
+        return WalletTransaction.objects.filter(user=self.request.user)
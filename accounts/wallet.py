@@ -0,0 +1,64 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import CustomUser, WalletTransaction
+
+
+class WalletError(Exception):
+    pass
+
+
+# Balance changes are single conditional UPDATEs (no read-modify-write), so
+# concurrent debits can't lose updates or overdraw; the ledger row is written in
+# the same transaction, while the user row is still locked by the UPDATE.
+
+def credit(user, amount, kind='deposit', reference=''):
+    return change_balance(user, positive(amount), kind, reference)
+
+
+def debit(user, amount, kind='purchase', reference=''):
+    return change_balance(user, -positive(amount), kind, reference)
+
+
+def positive(amount):
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise WalletError("مبلغ باید بیشتر از صفر باشد")
+    return amount
+
+
+def change_balance(user, amount, kind, reference):
+    with transaction.atomic():
+        wallet = CustomUser.objects.filter(pk=user.pk)
+        if amount < 0:
+            wallet = wallet.filter(wallet_balance__gte=-amount)
+        if not wallet.update(wallet_balance=F('wallet_balance') + amount):
+            raise WalletError("موجودی کیف پول کافی نیست")
+        balance = CustomUser.objects.filter(pk=user.pk).values_list('wallet_balance', flat=True).get()
+        return WalletTransaction.objects.create(
+            user_id=user.pk, amount=amount, balance_after=balance, kind=kind, reference=reference
+        )
+
+
+# Resets wallet_balance to the ledger sum for users whose cached balance drifted
+# (e.g. after raw SQL or manual edits). Each batch locks its user rows first so
+# no debit commits between summing and writing. Returns the number of fixed users.
+def reconcile(batch_size=1000):
+    ledger = (WalletTransaction.objects.filter(user=OuterRef('pk')).order_by().values('user')
+              .annotate(total=Sum('amount')).values('total'))
+    ledger_balance = Coalesce(Subquery(ledger), Decimal('0'))
+
+    fixed = 0
+    last_pk = 0
+    while True:
+        pks = list(CustomUser.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return fixed
+        with transaction.atomic():
+            list(CustomUser.objects.select_for_update().filter(pk__in=pks).values_list('pk'))
+            drifted = list(CustomUser.objects.filter(pk__in=pks).annotate(ledger=ledger_balance)
+                           .exclude(wallet_balance=F('ledger')).values_list('pk', flat=True))
+            if drifted:
+                fixed += CustomUser.objects.filter(pk__in=drifted).update(wallet_balance=ledger_balance)
+        last_pk = pks[-1]
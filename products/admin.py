@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, FileManager, Cart, Order, OrderItem, Review
+from .models import Category, Product, ProductImage, FileManager, Cart, StockReservation, Order, OrderItem, Review
+from .files import store_upload
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,9 +9,10 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'is_active')
+    list_display = ('name', 'sku', 'price', 'stock', 'reserved', 'avg_rating', 'review_count', 'is_active')
+    readonly_fields = ('reserved', 'review_count', 'rating_sum', 'avg_rating')
     list_filter = ('is_active', 'category')
-    search_fields = ('name', 'brand')
+    search_fields = ('name', 'sku', 'brand')
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
@@ -18,12 +20,24 @@ class ProductImageAdmin(admin.ModelAdmin):
 
 @admin.register(FileManager)
 class FileManagerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'uploaded_at', 'is_active')
+    list_display = ('name', 'size', 'uploaded_at', 'is_active')
+    readonly_fields = ('size', 'content_hash')
+
+    def save_model(self, request, obj, form, change):
+        if 'file' in form.changed_data and form.cleaned_data['file']:
+            for field, value in store_upload(form.cleaned_data['file']).items():
+                setattr(obj, field, value)
+        super().save_model(request, obj, form, change)
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ('user', 'product', 'quantity', 'created_at')
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total_price', 'status', 'created_at')
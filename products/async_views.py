@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from .models import Product
+from .serializers import ProductSerializer, ProductListSerializer
+from .views import ProductViewSet, active_categories, category_tree, product_prefetches
+
+
+# Async entry points for the hot catalog reads (product list/search, product
+# detail, category tree) under ASGI. They render the same JSON as their
+# ProductViewSet / CategoryViewSet counterparts, without the response cache and
+# conditional GET; writes stay on the sync viewsets. Django's async ORM (like a
+# plain sync_to_async) runs on the one thread-sensitive executor thread, which
+# would serialize every catalog read of the process, so each request does all of
+# its blocking work (authentication, queries, cache lookups, storage checks) in
+# one `on_thread` call: a thread of the default executor, on one connection.
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+# The body and status DRF's exception handler gives a sync view.
+def error_response(exc):
+    response = exception_handler(exc, {})
+    return json_response(response.data, status=response.status_code)
+
+
+# Same status and challenge as the sync views, whose first authenticator is the
+# bearer token one.
+def authentication_error(exc):
+    response = error_response(exc)
+    response['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+async def on_thread(function, *args):
+    return await sync_to_async(on_connection, thread_sensitive=False)(function, *args)
+
+
+# The thread's connection is closed or reused per CONN_MAX_AGE (or handed back
+# to the pool) afterwards, like a sync request's.
+def on_connection(function, *args):
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+# A DRF request authenticated up front like the sync viewsets' (bearer token,
+# session, Basic); raises AuthenticationFailed.
+def api_request(request):
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    request.user  # authenticates now, as APIView.initial does
+    return request
+
+
+# Same filters, search, ordering and pagination as ProductViewSet.list.
+def product_page(request):
+    request = api_request(request)
+    view = ProductViewSet(request=request, action='list', format_kwarg=None, args=(), kwargs={})
+    page = view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+    data = ProductListSerializer(page, many=True, context={'request': request}).data
+    return view.get_paginated_response(data).data
+
+
+# The product with its images and the reviews the user may see, or None.
+def product_data(request, pk):
+    request = api_request(request)
+    product = Product.objects.prefetch_related(*product_prefetches(request.user)).filter(pk=pk).first()
+    return ProductSerializer(product, context={'request': request}).data if product else None
+
+
+def category_tree_data(request):
+    return category_tree(active_categories(), request)
+
+
+@require_GET
+async def product_list(request):
+    try:
+        return json_response(await on_thread(product_page, request))
+    except AuthenticationFailed as e:
+        return authentication_error(e)
+    except APIException as e:
+        return error_response(e)
+
+
+@require_GET
+async def product_detail(request, pk):
+    try:
+        data = await on_thread(product_data, request, pk)
+    except AuthenticationFailed as e:
+        return authentication_error(e)
+    if data is None:
+        return json_response({'detail': 'No Product matches the given query.'}, status=404)
+    return json_response(data)
+
+
+@require_GET
+async def category_tree_view(request):
+    return json_response(await on_thread(category_tree_data, request))
@@ -0,0 +1,139 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.response import Response
+from .models import Category, Product, ProductImage, Review
+
+
+# Serialized catalog responses are cached under keys that embed the current
+# generation of every tag they depend on ('products', 'product:<pk>', ...).
+# Writes bump the affected tags, which orphans exactly the stale entries.
+# Stock changes made by reservations/checkout are not tag writes: cached
+# stock figures may lag by at most CATALOG_CACHE_TIMEOUT.
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def tag_key(tag):
+    return f'catalog:gen:{tag}'
+
+
+def get_generations(tags):
+    cache = catalog_cache()
+    keys = [tag_key(tag) for tag in tags]
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # Start unknown tags at a timestamp so an evicted tag can't reuse an old generation.
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        generations.update(cache.get_many(missing))
+    return [generations.get(key, 0) for key in keys]
+
+
+def bump(*tags):
+    cache = catalog_cache()
+    for tag in tags:
+        try:
+            cache.incr(tag_key(tag))
+        except ValueError:
+            cache.set(tag_key(tag), time.time_ns(), None)
+
+
+# Bumps now and again after commit, so a reader can't re-cache the old rows
+# between the bump and the commit.
+def invalidate(*tags):
+    bump(*tags)
+    transaction.on_commit(lambda: bump(*tags))
+
+
+# For bulk writes that bypass model signals (imports, QuerySet.update()).
+def invalidate_catalog():
+    invalidate('catalog')
+
+
+def count(event):
+    cache = catalog_cache()
+    key = f'catalog:stats:{event}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def cache_stats():
+    stats = catalog_cache().get_many(['catalog:stats:hit', 'catalog:stats:miss'])
+    return {'hits': stats.get('catalog:stats:hit', 0), 'misses': stats.get('catalog:stats:miss', 0)}
+
+
+# DRF Hyperlink values pickle their `str(obj)` name, which can hit the database
+# (e.g. Review.__str__), so responses are cached as plain dicts/lists/strings.
+def plain(data):
+    if isinstance(data, dict):
+        return {key: plain(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [plain(value) for value in data]
+    if isinstance(data, str):
+        return str(data)
+    return data
+
+
+# Caches list/retrieve responses of a viewset. Views declare their tags with
+# `cache_list_tags` and `cache_detail_tags` (formatted with the object pk).
+class CachedCatalogMixin:
+    cache_list_tags = ()
+    cache_detail_tags = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.cache_list_tags, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        tags = [tag.format(pk=kwargs.get(self.lookup_url_kwarg or self.lookup_field)) for tag in self.cache_detail_tags]
+        return self.cached_response(tags, super().retrieve, request, *args, **kwargs)
+
+    def cache_key(self, request, tags):
+        generations = '.'.join(map(str, get_generations(['catalog', *tags])))
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        signature = hashlib.md5(repr((request.get_host(), params)).encode()).hexdigest()
+        audience = 'staff' if request.user.is_staff else 'public'
+        return f'catalog:{self.basename}:{self.action}:{audience}:{self.kwargs.get("pk")}:{generations}:{signature}'
+
+    def cached_response(self, tags, render, request, *args, **kwargs):
+        cache = catalog_cache()
+        key = self.cache_key(request, tags)
+        data = cache.get(key)
+        if data is not None:
+            count('hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+        count('miss')
+        response = render(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, plain(response.data), settings.CATALOG_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    invalidate('products', f'product:{instance.pk}')
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_product_relation(sender, instance, **kwargs):
+    invalidate('products', f'product:{instance.product_id}')
+
+# Category changes alter product filtering and deleting one nulls Product.category
+# without model signals, so they also invalidate product responses.
+@receiver(post_save, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate('categories', 'products')
+
+@receiver(post_delete, sender=Category)
+def invalidate_deleted_category(sender, instance, **kwargs):
+    invalidate('categories', 'catalog')
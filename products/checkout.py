@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models import F, Q
+from .models import Product, Cart, Order, OrderItem, StockReservation
+from .reservations import quantity_by_product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+# Turns the user's cart into an order with a fixed number of queries per cart.
+# The user's stock holds are locked first, then the cart is loaded together with
+# its products, locking the product rows in product id order (so concurrent
+# checkouts can't deadlock). Stock is decremented and the holds are consumed by one
+# conditional UPDATE, and the order items are inserted with bulk_create.
+def checkout(user, shipping_address):
+    with transaction.atomic():
+        held = dict(
+            StockReservation.objects.select_for_update().filter(user=user).order_by('product_id')
+            .values_list('product_id', 'quantity')
+        )
+        items = list(
+            Cart.objects.filter(user=user).select_related('product')
+            .select_for_update(of=('self', 'product')).order_by('product_id')
+        )
+        if not items:
+            raise CheckoutError("سبد خرید خالی است")
+
+        # A line may use its own hold plus whatever stock nobody else holds.
+        held = {item.product_id: held.get(item.product_id, 0) for item in items}
+        for item in items:
+            product = item.product
+            if product.stock - product.reserved + held[item.product_id] < item.quantity:
+                raise CheckoutError(f"موجودی {product.name} کافی نیست")
+
+        in_stock = Q()
+        for item in items:
+            in_stock |= Q(pk=item.product_id, stock__gte=F('reserved') - held[item.product_id] + item.quantity)
+        ordered = {item.product_id: item.quantity for item in items}
+        updated = Product.objects.filter(in_stock).update(
+            stock=F('stock') - quantity_by_product(ordered),
+            reserved=F('reserved') - quantity_by_product(held),
+        )
+        if updated != len(items):
+            raise CheckoutError("موجودی کافی نیست")
+
+        order = Order.objects.create(
+            user=user,
+            total_price=sum(item.product.price * item.quantity for item in items),
+            shipping_address=shipping_address
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+            for item in items
+        ])
+        StockReservation.objects.filter(user=user, product_id__in=ordered).delete()
+        Cart.objects.filter(pk__in=[item.pk for item in items]).delete()
+    return order
@@ -0,0 +1,74 @@
+import hashlib
+from django.core.exceptions import ValidationError
+from django.db.models import Max, Subquery
+from django.db.models.functions import Greatest, Now
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import CatalogDeletion, Product, ProductImage, Review
+
+
+# Conditional GET for catalog endpoints. Catalog rows carry updated_at, which a
+# trigger advances on every UPDATE (migration 0016); images and reviews also touch
+# their product, whose detail renders them, and every DELETE is logged per table
+# in CatalogDeletion. A response is validated by one aggregate: the later of the
+# table's last deletion and the latest updated_at of the detail's rows or, for a
+# list, of the whole table (an UPDATE that moves a row out of a filtered list
+# changes nothing the remaining rows show). Both are index lookups. A matching
+# If-None-Match / If-Modified-Since gets 304 before the response cache or any
+# serializer is involved. (A list can miss an update that commits after a newer
+# one was already served, until its next change.)
+
+class ConditionalGetMixin:
+    # Rows whose changes invalidate a response: the object on retrieve, the whole
+    # table for lists.
+    def validator_queryset(self):
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            return self.filter_queryset(queryset).filter(
+                **{self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+            )
+        return queryset.model._default_manager.all()
+
+    # Who the representation is for; part of the ETag.
+    def audience(self, request):
+        return 'staff' if request.user.is_staff else 'public'
+
+    def validators(self, request):
+        queryset = self.validator_queryset()
+        deleted = CatalogDeletion.objects.filter(table=queryset.model._meta.db_table).values('deleted_at')
+        last_modified = queryset.order_by().aggregate(
+            last_modified=Greatest(Max('updated_at'), Subquery(deleted))
+        )['last_modified']
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        signature = repr((self.basename, self.action, self.audience(request), request.get_host(), params, last_modified))
+        return f'"{hashlib.md5(signature.encode()).hexdigest()}"', last_modified
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, render, request, *args, **kwargs):
+        try:
+            etag, last_modified = self.validators(request)
+        except (TypeError, ValueError, ValidationError):
+            return render(request, *args, **kwargs)  # malformed lookup, the view answers 404
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Review)
+def touch_product(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(updated_at=Now())
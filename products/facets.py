@@ -0,0 +1,44 @@
+from django.db.models import Count, Min, Q
+from django.db.models.functions import Upper
+from .filters import ProductFilter
+
+# Lower bounds of the price buckets; the last bucket is open-ended.
+PRICE_BUCKETS = [0, 100, 250, 500, 1000, 2500]
+MAX_FACET_VALUES = 50
+
+# ProductFilter parameters owned by each facet. A facet is counted over the result
+# set filtered by every *other* facet, so a selected value doesn't hide its siblings.
+FACET_PARAMS = {
+    'brand': ['brand'],
+    'size': ['size'],
+    'color': ['color'],
+    'price': ['min_price', 'max_price'],
+}
+
+
+def facet_counts(params, queryset):
+    facets = {}
+    for facet, own_params in FACET_PARAMS.items():
+        data = params.copy()
+        for name in own_params:
+            data.pop(name, None)
+        filtered = ProductFilter(data, queryset=queryset).qs.order_by()
+        facets[facet] = price_counts(filtered) if facet == 'price' else value_counts(filtered, facet)
+    return facets
+
+
+# Values are grouped case-insensitively, like the iexact filters that consume them.
+def value_counts(queryset, field):
+    rows = (queryset.exclude(**{field: ''}).values(key=Upper(field))
+            .annotate(value=Min(field), count=Count('pk')).order_by('-count', 'key')[:MAX_FACET_VALUES])
+    return [{'value': row['value'], 'count': row['count']} for row in rows]
+
+
+def price_counts(queryset):
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    buckets = {}
+    for i, (low, high) in enumerate(bounds):
+        in_bucket = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        buckets[f'bucket_{i}'] = Count('pk', filter=in_bucket)
+    counts = queryset.aggregate(**buckets)
+    return [{'min': low, 'max': high, 'count': counts[f'bucket_{i}']} for i, (low, high) in enumerate(bounds)]
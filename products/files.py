@@ -0,0 +1,333 @@
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from .models import FileManager, UploadSession
+
+
+# FileManager storage. Files live once per content under uploads/sha256/<ab>/<hash>
+# (on the local media filesystem), whatever their name and however often they're
+# uploaded. Large files are sent as a chunked upload: chunks are streamed to a
+# partial file and hashed as they arrive, and the finished file is moved into
+# place (or dropped, if that content is already stored). A client that declares
+# the SHA-256 of a stored file gets its FileManager row without sending any bytes;
+# that only reveals what the (public) file listing already shows.
+
+BLOCK_SIZE = 1024 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Hash state of sessions whose last chunk this process handled: {id: (offset, sha256)},
+# at most MAX_HASHERS of them (least recently used dropped first, so abandoned
+# uploads don't pile up). After a restart, an eviction, or when another process
+# took the previous chunk, the state is rebuilt from the partial file.
+MAX_HASHERS = 1000
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__("بازه ارسال‌شده با پیشرفت آپلود مطابقت ندارد")
+        self.offset = offset
+
+
+class ChunkInProgress(OffsetMismatch):
+    def __init__(self, offset):
+        UploadError.__init__(self, "بخش دیگری از این آپلود در حال ارسال است")
+        self.offset = offset
+
+
+def blob_name(digest):
+    return f'uploads/sha256/{digest[:2]}/{digest}'
+
+
+def partial_path(session):
+    return default_storage.path(f'uploads/partial/{session.pk}')
+
+
+def stored_size(digest):
+    name = blob_name(digest)
+    return default_storage.size(name) if default_storage.exists(name) else None
+
+
+def file_for(name, digest, size):
+    return FileManager.objects.create(name=name, file=blob_name(digest), content_hash=digest, size=size)
+
+
+# Single-request uploads (FileManagerSerializer): hashes the uploaded file and
+# stores it only if that content is new. Returns the model fields to save.
+def store_upload(uploaded):
+    hasher = hashlib.sha256()
+    for chunk in uploaded.chunks(BLOCK_SIZE):
+        hasher.update(chunk)
+    digest = hasher.hexdigest()
+    name = blob_name(digest)
+    if not default_storage.exists(name):
+        uploaded.seek(0)
+        name = default_storage.save(name, uploaded)
+    return {'file': name, 'content_hash': digest, 'size': uploaded.size}
+
+
+# FileManager rows stored before content hashing (migration 0015 added the columns
+# empty) get their size and SHA-256 from the stored file; the backfill_file_hashes
+# command runs this once. Returns (hashed, missing).
+def backfill_hashes():
+    hashed = missing = 0
+    for file_manager in FileManager.objects.filter(content_hash='').exclude(file='').only('file').iterator():
+        name = file_manager.file.name
+        if not default_storage.exists(name):
+            missing += 1
+            continue
+        hasher = hashlib.sha256()
+        size = 0
+        with default_storage.open(name, 'rb') as stored:
+            for block in iter(lambda: stored.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+                size += len(block)
+        FileManager.objects.filter(pk=file_manager.pk).update(size=size, content_hash=hasher.hexdigest())
+        hashed += 1
+    return hashed, missing
+
+
+# Returns (session, None), or (None, file) when the declared content is already
+# stored (or empty) and nothing has to be sent.
+def start(name, size, sha256=''):
+    if sha256 and stored_size(sha256) == size:
+        return None, file_for(name, sha256, size)
+    if size == 0:
+        return None, store_empty(name)
+    return UploadSession.objects.create(name=name, size=size, sha256=sha256), None
+
+
+def store_empty(name):
+    digest = hashlib.sha256().hexdigest()
+    if not default_storage.exists(blob_name(digest)):
+        default_storage.save(blob_name(digest), ContentFile(b''))
+    return file_for(name, digest, 0)
+
+
+# Writes one chunk, given its Content-Range header and the request body stream.
+# Chunks must arrive in order: a chunk that doesn't start at the session's offset
+# raises OffsetMismatch (the client resumes from `offset`). The body is written
+# outside any transaction: a short locked step claims the session for
+# FILE_UPLOAD_CHUNK_LEASE (a retried chunk meanwhile gets ChunkInProgress), and a
+# second statement advances `received` only if the claim still holds. Returns
+# (session, None), or (None, file) once the last chunk is in.
+def append(upload_id, content_range, stream, length):
+    match = CONTENT_RANGE.match(content_range or '')
+    if not match:
+        raise UploadError("هدر Content-Range معتبر نیست")
+    first, last, total = map(int, match.groups())
+    if last < first or last - first + 1 != length:
+        raise UploadError("طول بخش با Content-Range مطابقت ندارد")
+    if length > settings.FILE_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError("اندازه بخش بیش از حد مجاز است")
+
+    session = claim(upload_id, first, last, total)
+    path = partial_path(session)
+    try:
+        hasher = write_chunk(session, path, first, stream, length)
+    except BaseException:
+        UploadSession.objects.filter(pk=session.pk, writing_until=session.writing_until).update(writing_until=None)
+        raise
+
+    claimed = UploadSession.objects.filter(pk=session.pk, writing_until=session.writing_until)
+    session.received = last + 1
+    session.writing_until = None
+    if session.received < session.size:
+        if not claimed.update(received=session.received, writing_until=None, updated_at=timezone.now()):
+            raise UploadError("مهلت ارسال بخش به پایان رسید")
+        remember_hasher(session, hasher)
+        return session, None
+    if not claimed.delete()[0]:
+        raise UploadError("مهلت ارسال بخش به پایان رسید")
+    digest = hasher.hexdigest()
+    if not session.sha256 or session.sha256 == digest:
+        return None, finish(session, path, digest)
+    os.remove(path)
+    raise UploadError("هش فایل با مقدار اعلام‌شده مطابقت ندارد")
+
+
+def claim(upload_id, first, last, total):
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=upload_id)
+        if total != session.size or last >= session.size:
+            raise UploadError("اندازه کل فایل با آپلود مطابقت ندارد")
+        if first != session.received:
+            raise OffsetMismatch(session.received)
+        now = timezone.now()
+        if session.writing_until and session.writing_until > now:
+            raise ChunkInProgress(session.received)
+        session.writing_until = now + settings.FILE_UPLOAD_CHUNK_LEASE
+        session.save(update_fields=['writing_until', 'updated_at'])
+    return session
+
+
+def write_chunk(session, path, first, stream, length):
+    hasher = hasher_at(session, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as partial:
+        partial.seek(first)
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                raise UploadError("بخش به‌طور کامل دریافت نشد")
+            partial.write(block)
+            hasher.update(block)
+            remaining -= len(block)
+        # Drops whatever an interrupted earlier attempt wrote past this chunk.
+        partial.truncate()
+    return hasher
+
+
+def remember_hasher(session, hasher):
+    with _hashers_lock:
+        _hashers[session.pk] = (session.received, hasher)
+        _hashers.move_to_end(session.pk)
+        while len(_hashers) > MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def hasher_at(session, path):
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(session.pk, (None, None))
+    if offset == session.received:
+        return hasher
+    hasher = hashlib.sha256()
+    if session.received:
+        with open(path, 'rb') as partial:
+            remaining = session.received
+            while remaining:
+                block = partial.read(min(BLOCK_SIZE, remaining))
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+# Moves the completed partial file into place, unless that content is stored already.
+def finish(session, path, digest):
+    target = default_storage.path(blob_name(digest))
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return file_for(session.name, digest, session.size)
+
+
+def abort(session):
+    path = partial_path(session)
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    session.delete()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Sessions untouched for FILE_UPLOAD_SESSION_TTL, with their partial files.
+def purge_stale_sessions():
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - settings.FILE_UPLOAD_SESSION_TTL)
+    count = 0
+    for session in stale.iterator():
+        abort(session)
+        count += 1
+    return count
+
+
+# Downloads. With FILE_DOWNLOAD_MODE 'x-accel' (nginx) or 'x-sendfile' (Apache,
+# lighttpd) the response only names the file and the web server sends it,
+# including Range requests; 'django' streams it from the worker (development).
+def download_response(request, file_manager):
+    if not file_manager.file or not default_storage.exists(file_manager.file.name):
+        raise Http404
+    path = file_manager.file.path
+    content_type = mimetypes.guess_type(file_manager.name)[0] or 'application/octet-stream'
+    mode = settings.FILE_DOWNLOAD_MODE
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + quote(file_manager.file.name)
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = local_response(request, path, content_type, os.path.getsize(path), etag(file_manager))
+    response['Content-Disposition'] = content_disposition_header(True, file_manager.name)
+    return response
+
+
+def etag(file_manager):
+    return f'"{file_manager.content_hash}"' if file_manager.content_hash else None
+
+
+def local_response(request, path, content_type, size, tag):
+    if_range = request.headers.get('If-Range')
+    requested = request.headers.get('Range')
+    if requested and (if_range is None or (tag and if_range == tag)):
+        try:
+            byte_range = parse_range(requested, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            first, last = byte_range
+            response = StreamingHttpResponse(read_range(path, first, last), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = last - first + 1
+            response['Accept-Ranges'] = 'bytes'
+            if tag:
+                response['ETag'] = tag
+            return response
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    if tag:
+        response['ETag'] = tag
+    return response
+
+
+# A single `bytes=first-last` / `bytes=first-` / `bytes=-suffix` range as
+# (first, last), or None to send the whole file (malformed or multiple ranges
+# are ignored, as RFC 9110 allows). Raises ValueError when unsatisfiable.
+def parse_range(header, size):
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def read_range(path, first, last):
+    with open(path, 'rb') as stored:
+        stored.seek(first)
+        remaining = last - first + 1
+        while remaining:
+            block = stored.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
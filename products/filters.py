@@ -1,5 +1,8 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
 from django_filters import rest_framework as filters
-from .models import Product
+from rest_framework.filters import OrderingFilter
+from .models import Category, Product, Order, OrderItem
 
 # This filter class is used to filter products based on various criteria.
 class ProductFilter(filters.FilterSet):
@@ -8,7 +11,46 @@ class ProductFilter(filters.FilterSet):
     color = filters.CharFilter(field_name='color', lookup_expr='iexact')  
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte') 
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')  
+    category_subtree = filters.NumberFilter(method='filter_category_subtree')
+    min_rating = filters.NumberFilter(field_name='avg_rating', lookup_expr='gte')
 
     class Meta:
         model = Product
-        fields = ['brand', 'size', 'color', 'min_price', 'max_price']
\ No newline at end of file
+        fields = ['brand', 'size', 'color', 'min_price', 'max_price', 'category_subtree', 'min_rating']
+
+    # Products of a category and all of its descendants: an indexed prefix scan
+    # on Category.path feeding an IN lookup on Product.category.
+    def filter_category_subtree(self, queryset, name, value):
+        category = Category.objects.filter(pk=value).only('path').first()
+        if category is None:
+            return queryset.none()
+        return queryset.filter(category__in=category.get_descendants().values('pk'))
+
+# `?ordering=` with the primary key appended, so products sharing a price or rating
+# keep a stable order and are neither skipped nor repeated across offset pages.
+class UniqueOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and ordering[-1].lstrip('-') not in ('pk', 'id'):
+            ordering = [*ordering, '-pk']
+        return ordering
+
+def start_of_day(value):
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+# Filters the order line export. Dates are whole days in the site time zone and
+# compare against Order.created_at directly, so the created_at indexes apply.
+class OrderExportFilter(filters.FilterSet):
+    date_from = filters.DateFilter(method='filter_date_from')
+    date_to = filters.DateFilter(method='filter_date_to')
+    status = filters.ChoiceFilter(field_name='order__status', choices=Order.STATUS_CHOICES)
+
+    class Meta:
+        model = OrderItem
+        fields = ['date_from', 'date_to', 'status']
+
+    def filter_date_from(self, queryset, name, value):
+        return queryset.filter(order__created_at__gte=start_of_day(value))
+
+    def filter_date_to(self, queryset, name, value):
+        return queryset.filter(order__created_at__lt=start_of_day(value + timedelta(days=1)))
@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+from .cache import invalidate_catalog
+from .models import Category, Product
+from .search import deferred_search_vectors
+from .serializers import ProductImportSerializer
+
+FILE_FORMATS = ('csv', 'jsonl')
+# Columns of an import/export file; `category` holds the category name.
+COLUMNS = ProductImportSerializer.Meta.fields
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension, default)
+
+
+# Yields `(line, row)` pairs from a binary file object, one row at a time. A row
+# that can't be decoded is yielded as an error message instead of a dict.
+def read_rows(stream, file_format):
+    if file_format not in FILE_FORMATS:
+        raise ImportFormatError(f"فرمت {file_format} پشتیبانی نمی‌شود")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Empty cells are treated like a missing JSON key (see import_chunk).
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, f"JSON نامعتبر: {e}"
+            continue
+        yield line, row if isinstance(row, dict) else "هر خط باید یک شیء JSON باشد"
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'imported': self.imported, 'failed': self.error_count, 'errors': self.errors}
+
+
+# Upserts products by sku from a CSV/JSONL stream in constant memory. Every chunk
+# is validated, written with one INSERT ... ON CONFLICT (sku) DO UPDATE and gets
+# its search vectors computed in one pass, in its own transaction; rows that fail
+# validation are reported by line and skipped. Counter columns (reserved, review
+# aggregates) are never overwritten.
+def import_products(stream, file_format, batch_size=1000):
+    report = ImportReport()
+    rows = read_rows(stream, file_format)
+    # One serializer per mode validates every row, so their fields are only built once.
+    validators = (ProductImportSerializer(), ProductImportSerializer(partial=True))
+    while chunk := list(islice(rows, batch_size)):
+        import_chunk(chunk, validators, report, batch_size)
+    invalidate_catalog()
+    return report
+
+
+# A row only writes the columns it has: an existing product keeps every other
+# column, so partial feeds (e.g. sku,price) can update products in place. New
+# products need the required columns and get model defaults for the rest.
+def import_chunk(chunk, validators, report, batch_size):
+    skus = [str(row['sku']) for _, row in chunk if isinstance(row, dict) and row.get('sku') is not None]
+    existing = set(Product.objects.filter(sku__in=skus).values_list('sku', flat=True)) if skus else set()
+    valid = []
+    for line, row in chunk:
+        if isinstance(row, str):
+            report.add_error(line, {'non_field_errors': [row]})
+            continue
+        validator = validators[str(row.get('sku')) in existing]
+        try:
+            valid.append((line, validator.run_validation(row)))
+        except ValidationError as e:
+            report.add_error(line, as_serializer_error(e))
+
+    names = {data['category'] for _, data in valid if data.get('category')}
+    categories = dict(Category.objects.filter(name__in=names).values_list('name', 'pk')) if names else {}
+    # A sku repeated within a chunk can't be upserted twice by one statement; the last row wins.
+    products = {}
+    for line, data in valid:
+        columns = frozenset(data) - {'sku'}
+        if 'category' in data:
+            name = data.pop('category')
+            if name and name not in categories:
+                report.add_error(line, {'category': [f"دسته‌بندی {name} یافت نشد"]})
+                continue
+            data['category_id'] = categories.get(name)
+        products[data['sku']] = (columns, Product(**data))
+    if not products:
+        return
+
+    # One upsert per set of columns present; usually the file's header.
+    groups = {}
+    for columns, product in products.values():
+        groups.setdefault(columns, []).append(product)
+    with deferred_search_vectors(batch_size=batch_size):
+        for columns, group in groups.items():
+            if columns:
+                Product.objects.bulk_create(group, update_conflicts=True, unique_fields=['sku'],
+                                            update_fields=[field for field in COLUMNS if field in columns])
+            else:
+                Product.objects.bulk_create(group, ignore_conflicts=True)
+    report.imported += len(products)
+
+
+# Write-through buffer for csv.writer: each writerow() returns the encoded line.
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+# Streams `values_list()` rows as CSV/JSONL lines through a server-side cursor.
+def stream_rows(file_format, columns, rows):
+    if file_format not in FILE_FORMATS:
+        raise ImportFormatError(f"فرمت {file_format} پشتیبانی نمی‌شود")
+    return csv_lines(columns, rows) if file_format == 'csv' else ndjson_lines(columns, rows)
+
+
+def export_products(file_format, queryset=None, chunk_size=2000):
+    queryset = Product.objects.all() if queryset is None else queryset
+    fields = [column if column != 'category' else 'category__name' for column in COLUMNS]
+    return stream_rows(file_format, COLUMNS, queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size))
+
+
+# One row per order line, with the product name joined in (not loaded per row).
+ORDER_ITEM_COLUMNS = {
+    'order_id': 'order_id',
+    'created_at': 'order__created_at',
+    'status': 'order__status',
+    'username': 'order__user__username',
+    'product_id': 'product_id',
+    'product_name': 'product__name',
+    'quantity': 'quantity',
+    'price': 'price',
+    'line_total': 'line_total',
+}
+
+
+def export_order_items(file_format, queryset, chunk_size=2000):
+    rows = (queryset.annotate(line_total=F('price') * F('quantity'))
+            .order_by('order__created_at', 'order_id', 'pk')
+            .values_list(*ORDER_ITEM_COLUMNS.values()).iterator(chunk_size=chunk_size))
+    return stream_rows(file_format, list(ORDER_ITEM_COLUMNS), rows)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.files import backfill_hashes
+
+
+class Command(BaseCommand):
+    help = 'Fill FileManager.size and content_hash for files stored before content hashing'
+
+    def handle(self, *args, **options):
+        hashed, missing = backfill_hashes()
+        self.stdout.write(self.style.SUCCESS(f'{hashed} files hashed, {missing} missing'))
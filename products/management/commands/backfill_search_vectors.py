@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Fill Product.search_vector in batches (only empty vectors unless --all is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Recompute every product, not only empty vectors')
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(search_vector__isnull=True)
+        updated = refresh_search_vectors(queryset, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} products updated'))
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from products.models import Product
+
+# Read endpoints under /api/products/ (sync) and /api/products/async/ (products.async_views).
+ENDPOINTS = {
+    'list': 'products/',
+    'search': 'products/?search={search}',
+    'detail': 'products/{pk}/',
+    'tree': 'categories/tree/',
+}
+
+# (server, handler, URL prefix): the sync viewsets under WSGI and ASGI, and the async views under ASGI.
+SERVERS = [
+    ('wsgi', 'wsgi', '/api/products/'),
+    ('asgi-sync', 'asgi', '/api/products/'),
+    ('asgi', 'asgi', '/api/products/async/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and p99 latency of the catalog reads under WSGI (sync views) and ASGI (async views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight (WSGI threads)')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=ENDPOINTS,
+                            help='Endpoint to test (repeatable)')
+        parser.add_argument('--search', default='shirt')
+        parser.add_argument('--keep-cache', action='store_true',
+                            help='Keep the catalog response cache (by default a dummy cache makes every sync read hit the database)')
+
+    def handle(self, *args, **options):
+        pks = list(Product.objects.order_by('-pk').values_list('pk', flat=True)[:500])
+        if not pks:
+            raise CommandError('No products to read; seed some with benchmark_catalog --seed')
+        # Requests go straight to the WSGI/ASGI handlers, as a server would call them,
+        # minus the HTTP parsing and sockets every server adds to both sides alike.
+        overrides = {'ALLOWED_HOSTS': ['*']}
+        if not options['keep_cache']:
+            overrides['CACHES'] = {**settings.CACHES,
+                                   'benchmark-catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            overrides['CATALOG_CACHE_ALIAS'] = 'benchmark-catalog'
+        # One thread pool for every WSGI run, so persistent connections (CONN_MAX_AGE)
+        # stay one per thread as on a threaded server.
+        with override_settings(**overrides), ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            self.executor = executor
+            handlers = {'wsgi': get_wsgi_application(), 'asgi': get_asgi_application()}
+            database = settings.DATABASES['default']
+            self.stdout.write(f"{options['requests']} requests per run, {options['concurrency']} in flight, "
+                              + ('connection pool' if database['OPTIONS'].get('pool')
+                                 else f"CONN_MAX_AGE={database['CONN_MAX_AGE']}"))
+            self.stdout.write(f"{'endpoint':<8} {'server':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for endpoint in options['endpoints'] or ENDPOINTS:
+                for server, handler, prefix in SERVERS:
+                    urls = [prefix + ENDPOINTS[endpoint].format(pk=pk, search=options['search'])
+                            for pk in itertools.islice(itertools.cycle(pks), options['requests'])]
+                    run = self.run_wsgi if handler == 'wsgi' else self.run_asgi
+                    run(handlers[handler], urls[:options['concurrency']], options['concurrency'])  # warm-up
+                    started = time.perf_counter()
+                    results = run(handlers[handler], urls, options['concurrency'])
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(self.report(endpoint, server, results, elapsed))
+
+    def report(self, endpoint, server, results, elapsed):
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(status != 200 for status, _ in results)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        return f'{endpoint:<8} {server:<10} {len(results) / elapsed:8.1f} {p50:8.1f} {p99:8.1f} {errors:7}'
+
+    # One thread per request in flight, like a threaded WSGI server.
+    def run_wsgi(self, application, urls, concurrency):
+        return list(self.executor.map(lambda url: wsgi_get(application, url), urls))
+
+    # One event loop, `concurrency` requests in flight, like uvicorn with one worker.
+    def run_asgi(self, application, urls, concurrency):
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def request(url):
+                async with slots:
+                    return await asgi_get(application, url)
+            return await asyncio.gather(*(request(url) for url in urls))
+        return asyncio.run(main())
+
+
+def wsgi_get(application, url):
+    path, _, query = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'localhost',
+        'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO(),
+    }
+    statuses = []
+    started = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return int(statuses[0].split()[0]), time.perf_counter() - started
+
+
+async def asgi_get(application, url):
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+    }
+    requested = False
+    statuses = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Event().wait()  # the client never disconnects
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return statuses[0], time.perf_counter() - started
@@ -0,0 +1,100 @@
+import random
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from products.filters import ProductFilter
+from products.models import Category, Product
+from products.search import deferred_search_vectors, search_products
+from products.serializers import ProductListSerializer
+
+BRANDS = ['Nike', 'Adidas', 'Puma', 'Zara', 'Mango', 'LC Waikiki', 'Samsung', 'Xiaomi']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', '42', '43', '44']
+COLORS = ['Red', 'Blue', 'Black', 'White', 'Green', 'Gray']
+NOUNS = ['shirt', 'shoe', 'jacket', 'phone', 'dress', 'watch', 'bag', 'hat', 'scarf', 'lamp']
+# A few hundred filler words so full-text matches are as selective as in a real catalog.
+WORDS = NOUNS + [a + b for a in ['ka', 'lo', 'mi', 'ra', 'su', 'te', 'vo', 'ze', 'ni', 'pa', 'do', 'gu']
+                 for b in ['ban', 'cor', 'dex', 'fil', 'gom', 'lin', 'mar', 'nop', 'ros', 'tav', 'vul', 'xen']]
+
+# Standard storefront filter mixes; '{category}' is replaced with a seeded root category.
+FILTER_MIXES = [
+    ('newest', {}),
+    ('brand', {'brand': 'nike'}),
+    ('brand + price range', {'brand': 'nike', 'min_price': 100, 'max_price': 500}),
+    ('size + color', {'size': 'm', 'color': 'red'}),
+    ('category subtree + price', {'category_subtree': '{category}', 'max_price': 300}),
+    ('min rating, best first', {'min_rating': 4, 'ordering': '-avg_rating'}),
+    ('search', {'search': 'kaban jacket'}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Seed a large catalog (optional) and record EXPLAIN plans and latencies of the standard product filter mixes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Number of products to insert before measuring')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--plans', action='store_true', help='Print EXPLAIN ANALYZE output for every mix')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        category = Category.objects.filter(parent__isnull=True).values_list('pk', flat=True).first()
+
+        self.stdout.write(f"{Product.objects.count()} products, {options['repeat']} runs per mix")
+        for label, params in FILTER_MIXES:
+            params = {key: category if value == '{category}' else value for key, value in params.items()}
+            queryset = self.build_queryset(params)
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'{label:<28} median {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms')
+            if options['plans']:
+                self.stdout.write(queryset.explain(analyze=True))
+                self.stdout.write('')
+
+    # Same queryset ProductViewSet.list builds for a first page.
+    def build_queryset(self, params):
+        queryset = Product.objects.all()
+        if params.get('search'):
+            queryset = search_products(queryset, params['search'])
+        queryset = ProductFilter(params, queryset=queryset).qs
+        if params.get('ordering'):
+            queryset = queryset.order_by(params['ordering'], '-pk')
+        elif not queryset.query.order_by:
+            queryset = queryset.order_by('-created_at')
+        return queryset.only(*ProductListSerializer.queryset_fields)[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+
+    def seed(self, count, batch_size=5000):
+        rng = random.Random(42)
+        roots = [Category.objects.get_or_create(name=f'Benchmark {i}')[0] for i in range(4)]
+        categories = roots + [Category.objects.get_or_create(name=f'Benchmark {i}.{j}', defaults={'parent': root})[0]
+                              for i, root in enumerate(roots) for j in range(5)]
+        self.stdout.write(f'Seeding {count} products...')
+        with deferred_search_vectors(batch_size=batch_size):
+            for start in range(0, count, batch_size):
+                Product.objects.bulk_create([
+                    Product(
+                        name=f'{rng.choice(WORDS)} {rng.choice(NOUNS)}',
+                        short_description=' '.join(rng.choices(WORDS, k=8)),
+                        long_description=' '.join(rng.choices(WORDS, k=60)),
+                        price=rng.randint(10, 2000),
+                        stock=rng.randint(0, 100),
+                        brand=rng.choice(BRANDS),
+                        size=rng.choice(SIZES),
+                        color=rng.choice(COLORS),
+                        is_active=rng.random() > 0.1,
+                        category=rng.choice(categories),
+                        review_count=(reviews := rng.randint(0, 50)),
+                        rating_sum=reviews * 3,
+                        avg_rating=round(rng.uniform(1, 5), 2) if reviews else 0,
+                    )
+                    for _ in range(min(batch_size, count - start))
+                ], batch_size=batch_size)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products_product')
@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import override_settings
+from products.models import Product
+from pulse_shop.postgresql import stats
+from .benchmark_asgi import asgi_get, wsgi_get
+
+MODES = ['none', 'persistent', 'pool']
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request latency with a new connection per request, persistent connections and a connection pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight (threads per worker)')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES, help='Mode to test (repeatable)')
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--path', default='/api/products/products/{pk}/',
+                            help='Request path; {pk} is replaced with recent product ids')
+
+    def handle(self, *args, **options):
+        pks = list(Product.objects.order_by('-pk').values_list('pk', flat=True)[:500])
+        if not pks:
+            raise CommandError('No products to read; seed some with benchmark_catalog --seed')
+        urls = [options['path'].format(pk=pk) for pk in itertools.islice(itertools.cycle(pks), options['requests'])]
+        # Every request reaches the database: the catalog cache is a dummy one. The
+        # checkout counters stay in this process's memory, so flushing them to a
+        # database cache doesn't add checkouts of its own.
+        caches = {**settings.CACHES, 'benchmark-catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                  'benchmark-stats': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                      'LOCATION': 'benchmark-stats'}}
+        database = connections['default'].settings_dict
+        configured = {key: database[key] for key in ('CONN_MAX_AGE', 'OPTIONS')}
+        self.stdout.write(f"{options['requests']} requests per mode over {options['server'].upper()}, "
+                          f"{options['concurrency']} in flight")
+        self.stdout.write(f"{'mode':<11} {'req/s':>8} {'avg ms':>8} {'p50 ms':>8} {'p99 ms':>8} "
+                          f"{'checkouts':>10} {'wait ms':>8} {'errors':>7}")
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], CACHES=caches, CATALOG_CACHE_ALIAS='benchmark-catalog',
+                                   DB_STATS_CACHE='benchmark-stats'):
+                for mode in options['modes'] or MODES:
+                    self.configure(mode, options['concurrency'])
+                    self.stdout.write(self.run_mode(mode, urls, options))
+        finally:
+            self.configure(None, options['concurrency'], restore=configured)
+
+    # Switches the connection settings every thread's DatabaseWrapper reads.
+    def configure(self, mode, concurrency, restore=None):
+        database = connections['default']
+        connections.close_all()
+        if database.settings_dict['OPTIONS'].get('pool'):
+            database.close_pool()
+        if restore:
+            database.settings_dict.update(restore)
+        elif mode == 'pool':
+            database.settings_dict.update(CONN_MAX_AGE=0, OPTIONS={'pool': {'min_size': min(2, concurrency),
+                                                                            'max_size': concurrency}})
+        else:
+            database.settings_dict.update(CONN_MAX_AGE=600 if mode == 'persistent' else 0, OPTIONS={})
+
+    def run_mode(self, mode, urls, options):
+        concurrency = options['concurrency']
+        run = self.run_wsgi if options['server'] == 'wsgi' else self.run_asgi
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            run(executor, urls[:concurrency], concurrency)  # warm-up
+            before = stats.checkout_stats()
+            started = time.perf_counter()
+            results = run(executor, urls, concurrency)
+            elapsed = time.perf_counter() - started
+            after = stats.checkout_stats()
+            close_thread_connections(executor, concurrency)
+
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(status != 200 for status, _ in results)
+        checkouts = after['checkouts'] - before['checkouts']
+        attempts = checkouts + after['failures'] - before['failures']
+        waited = after['wait_ms'] - before['wait_ms']
+        return (f'{mode:<11} {len(results) / elapsed:8.1f} {sum(latencies) / len(latencies) * 1000:8.2f} '
+                f'{latencies[len(latencies) // 2] * 1000:8.2f} '
+                f'{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:8.2f} '
+                f'{checkouts:10} {waited / attempts if attempts else 0:8.2f} {errors:7}')
+
+    def run_wsgi(self, executor, urls, concurrency):
+        application = get_wsgi_application()
+        return list(executor.map(lambda url: wsgi_get(application, url), urls))
+
+    # Sync code under ASGI runs on a thread per request, not on `executor`.
+    def run_asgi(self, executor, urls, concurrency):
+        application = get_asgi_application()
+
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def request(url):
+                async with slots:
+                    return await asgi_get(application, url)
+            return await asyncio.gather(*(request(url) for url in urls))
+        return asyncio.run(main())
+
+
+# Runs connections.close_all() once on each of the executor's threads, so
+# persistent connections don't outlive the mode that opened them.
+def close_thread_connections(executor, threads):
+    barrier = threading.Barrier(threads)
+
+    def close(_):
+        barrier.wait()
+        connections.close_all()
+    list(executor.map(close, range(threads)))
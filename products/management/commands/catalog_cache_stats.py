@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show catalog response cache hit/miss counters'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit ratio: {ratio:.1%}")
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from pulse_shop.postgresql.stats import checkout_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show database connection checkout counters, pool settings and server-side connection counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the checkout counters afterwards')
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        pool = database['OPTIONS'].get('pool')
+        if pool:
+            self.stdout.write(f"pool: {pool.get('min_size', 4)}-{pool.get('max_size', pool.get('min_size', 4))} "
+                              f"connections per process, timeout {pool.get('timeout', 30)}s, "
+                              f"health checks {'on' if database['CONN_HEALTH_CHECKS'] else 'off'}")
+        else:
+            self.stdout.write(f"no pool, CONN_MAX_AGE={database['CONN_MAX_AGE']}, "
+                              f"health checks {'on' if database['CONN_HEALTH_CHECKS'] else 'off'}")
+        stats = checkout_stats()
+        self.stdout.write(f"checkouts: {stats['checkouts']}  failures: {stats['failures']}  "
+                          f"avg wait: {stats['avg_wait_ms']:.2f} ms")
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            limit = cursor.fetchone()[0]
+            cursor.execute("SELECT coalesce(state, 'background'), count(*) FROM pg_stat_activity "
+                           "WHERE datname = current_database() GROUP BY 1 ORDER BY 1")
+            states = cursor.fetchall()
+        total = sum(count for _, count in states)
+        self.stdout.write(f"server: {total}/{limit} connections ("
+                          + ', '.join(f'{state} {count}' for state, count in states) + ')')
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from products.importexport import export_products, guess_format, FILE_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or JSONL file (or stdout with "-")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=FILE_FORMATS, help='Defaults to the file extension')
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or guess_format(options['path'])
+        if options['path'] == '-':
+            for line in export_products(file_format):
+                self.stdout.write(line, ending='')
+            return
+        exported = 0
+        with open(options['path'], 'w', encoding='utf-8', newline='') as out:
+            for line in export_products(file_format):
+                out.write(line)
+                exported += 1
+        if file_format == 'csv':
+            exported -= 1
+        self.stdout.write(self.style.SUCCESS(f'{exported} products exported to {options["path"]}'))
@@ -0,0 +1,15 @@
+import os
+from django.core.management.base import BaseCommand
+from pulse_shop.renditions import backfill
+
+
+class Command(BaseCommand):
+    help = 'Generate missing image renditions for existing media in parallel (all of them with --force)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Resizing processes')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        generated, failed = backfill(max(options['workers'], 1), force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'{generated} images rendered, {failed} failed'))
@@ -0,0 +1,29 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from products.importexport import import_products, guess_format, ImportFormatError, FILE_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by sku from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=FILE_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--errors', help='Write the per-row error report to this JSON file')
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = import_products(stream, file_format, batch_size=options['batch_size'])
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8') as out:
+                json.dump(report.as_dict(), out, ensure_ascii=False, indent=2)
+        else:
+            for error in report.errors:
+                self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(f'{report.imported} products imported, {report.error_count} rows failed'))
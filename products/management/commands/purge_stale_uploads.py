@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.files import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads idle for longer than FILE_UPLOAD_SESSION_TTL, with their partial files'
+
+    def handle(self, *args, **options):
+        purged = purge_stale_sessions()
+        self.stdout.write(self.style.SUCCESS(f'{purged} stale uploads deleted'))
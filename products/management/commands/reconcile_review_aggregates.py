@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.cache import invalidate_catalog
+from products.ratings import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product review_count, rating_sum and avg_rating from approved reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = reconcile(batch_size=options['batch_size'])
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'{updated} products reconciled'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations (cart holds) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{released} reservations released'))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+# Mirrors products.search.product_search_vector(). While the transaction-local
+# `products.defer_search_vector` setting is on, the vector is cleared instead so
+# deferred_search_vectors() can refresh every touched row in one batch.
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('products.defer_search_vector', true) = 'on' THEN
+        NEW.search_vector := NULL;
+    ELSE
+        NEW.search_vector :=
+            setweight(to_tsvector(COALESCE(NEW.name, '')), 'A') ||
+            setweight(to_tsvector(COALESCE(NEW.short_description, '')), 'B') ||
+            setweight(to_tsvector(COALESCE(NEW.long_description, '')), 'C');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_search_vector
+BEFORE INSERT OR UPDATE OF name, short_description, long_description ON products_product
+FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS products_product_search_vector ON products_product;
+DROP FUNCTION IF EXISTS products_product_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_vector_gin'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('search_vector__isnull', True)), fields=['id'], name='product_search_vector_missing'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+FILL_AGGREGATES = """
+UPDATE products_product p
+SET review_count = s.review_count, rating_sum = s.rating_sum, avg_rating = round(s.rating_sum::numeric / s.review_count, 2)
+FROM (
+    SELECT product_id, count(*) AS review_count, sum(rating) AS rating_sum
+    FROM products_review WHERE is_approved GROUP BY product_id
+) s
+WHERE s.product_id = p.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(FILL_AGGREGATES, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-avg_rating'], name='product_avg_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 09:05
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0011_product_review_aggregates'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('brand'), models.F('price'), name='product_brand_upper_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('size'), name='product_size_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('color'), name='product_color_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'is_active'], name='product_cat_price_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'created_at'], name='product_active_created_idx'),
+        ),
+    ]
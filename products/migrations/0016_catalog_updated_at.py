@@ -0,0 +1,77 @@
+# Generated by Django 5.2 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+# Every UPDATE of a catalog row advances its updated_at, however it was issued
+# (save(), bulk_update(), QuerySet.update() from reservations, checkout, review
+# aggregates or imports). clock_timestamp() rather than the transaction start,
+# and never backwards, so a row's validator only ever moves forward. Every
+# DELETE statement records its time in products_catalogdeletion.
+TABLES = ['products_category', 'products_product', 'products_productimage', 'products_review']
+
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION products_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := GREATEST(clock_timestamp(), OLD.updated_at + interval '1 microsecond');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION products_record_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO products_catalogdeletion ("table", deleted_at) VALUES (TG_TABLE_NAME, clock_timestamp())
+    ON CONFLICT ("table") DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+""" + ''.join(f"""
+CREATE TRIGGER {table}_touch_updated_at
+BEFORE UPDATE ON {table}
+FOR EACH ROW EXECUTE FUNCTION products_touch_updated_at();
+
+CREATE TRIGGER {table}_record_deletion
+AFTER DELETE ON {table}
+FOR EACH STATEMENT EXECUTE FUNCTION products_record_deletion();
+""" for table in TABLES)
+
+DROP_TRIGGERS = ''.join(f"""
+DROP TRIGGER IF EXISTS {table}_touch_updated_at ON {table};
+DROP TRIGGER IF EXISTS {table}_record_deletion ON {table};
+""" for table in TABLES) + """
+DROP FUNCTION IF EXISTS products_touch_updated_at();
+DROP FUNCTION IF EXISTS products_record_deletion();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_file_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogDeletion',
+            fields=[
+                ('table', models.CharField(max_length=63, primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
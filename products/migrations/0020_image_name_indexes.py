@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 16:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0019_catalog_updated_at_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['main_image'], name='product_main_image_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='productimage',
+            index=models.Index(fields=['image'], name='productimage_image_idx'),
+        ),
+    ]
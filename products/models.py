@@ -1,8 +1,10 @@
+import uuid
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.db.models import F, Max, Value
+from django.db.models.functions import Concat, Substr, Upper
 from django.contrib.postgres.search import SearchVectorField
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.contrib.postgres.search import SearchVector
+from django.contrib.postgres.indexes import GinIndex
 from accounts.models import CustomUser
 
 
@@ -11,17 +13,68 @@ class Category(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Materialized path: zero-padded ids of the ancestors and the category itself,
+    # e.g. '0000000001/0000000007/'. A subtree is every path starting with this one.
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Each level adds 11 characters to `path`, so the tree can be 23 levels deep.
+    MAX_DEPTH = 255 // 11 - 1
+
+    def clean(self):
+        if self.pk and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': "دسته نمی‌تواند زیرمجموعه خودش باشد"})
+        if self.parent_id and not self.fits_under(self.parent):
+            raise ValidationError({'parent': "عمق دسته‌بندی بیش از حد مجاز است"})
+
+    # Whether this category and its subtree stay within MAX_DEPTH under `parent`.
+    def fits_under(self, parent):
+        height = 0
+        if self.pk and self.path:
+            deepest = self.get_descendants().aggregate(deepest=Max('depth'))['deepest']
+            height = deepest - self.depth
+        return parent.depth + 1 + height <= self.MAX_DEPTH
+
+    # Keeps path/depth of the category and, when it moved, of its whole subtree up to date.
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+        path = f'{parent_path}{self.pk:010d}/'
+        if path == self.path:
+            return
+        old_path, depth = self.path, path.count('/') - 1
+        Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + depth - self.depth,
+            )
+        self.path, self.depth = path, depth
+
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
 
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+            # Table-wide MAX(updated_at) validates list responses (products.conditional).
+            models.Index(fields=['updated_at'], name='category_updated_at_idx'),
+        ]
 
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     brand = models.CharField(max_length=100, blank=True)
     size = models.CharField(max_length=50, blank=True)
@@ -32,36 +85,105 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     main_image = models.ImageField(upload_to='products/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     search_vector = SearchVectorField(null=True, blank=True)
+    # Approved review aggregates, maintained incrementally by products.ratings.
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+
+    # Counter columns are only changed through F() updates (see products.reservations
+    # and products.ratings), so saving an existing product must not write back a stale copy.
+    counter_fields = ('reserved', 'review_count', 'rating_sum', 'avg_rating')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
-@receiver(post_save, sender=Product)
-def update_search_vector(sender, instance, **kwargs):
-    Product.objects.filter(pk=instance.pk).update(
-        search_vector=SearchVector('name', weight='A') +
-                     SearchVector('short_description', weight='B') +
-                     SearchVector('long_description', weight='C')
-    )
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved, 0)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            models.Index(fields=['id'], condition=models.Q(search_vector__isnull=True), name='product_search_vector_missing'),
+            models.Index(fields=['created_at'], name='product_created_at_idx'),
+            models.Index(fields=['-avg_rating'], name='product_avg_rating_idx'),
+            # ProductFilter facets: `iexact` compiles to UPPER(col) = UPPER(value).
+            models.Index(Upper('brand'), 'price', name='product_brand_upper_price_idx'),
+            models.Index(Upper('size'), name='product_size_upper_idx'),
+            models.Index(Upper('color'), name='product_color_upper_idx'),
+            # Category (subtree) listings with a price range; is_active trails for the admin filter.
+            models.Index(fields=['category', 'price', 'is_active'], name='product_cat_price_active_idx'),
+            # Active products, newest first.
+            models.Index(fields=['is_active', 'created_at'], name='product_active_created_idx'),
+            # Conditional GET validators (products.conditional): latest change first.
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+            # Rows showing an image whose renditions were just stored (products.renditions).
+            models.Index(fields=['main_image'], name='product_main_image_idx'),
+        ]
+
+# search_vector is maintained by the products_product_search_vector trigger (migration 0007),
+# so it stays correct for save(), bulk_create(), bulk_update() and QuerySet.update().
+# The same goes for updated_at of every catalog model (trigger of migration 0016).
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
     is_main = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
+    class Meta:
+        indexes = [
+            # Rows showing an image whose renditions were just stored (products.renditions).
+            models.Index(fields=['image'], name='productimage_image_idx'),
+        ]
+
+# Uploads are stored content-addressed (see products.files): rows with the same
+# content_hash share one file, so uploading a known file only adds a row.
 class FileManager(models.Model):
     name = models.CharField(max_length=200)
     file = models.FileField(upload_to='uploads/')
+    size = models.BigIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256, hex
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.name
 
+# Time of the last DELETE on each catalog table, written by a statement-level trigger
+# (migration 0016), so validators notice rows that disappeared from a listing.
+class CatalogDeletion(models.Model):
+    table = models.CharField(max_length=63, primary_key=True)
+    deleted_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.table} ({self.deleted_at})"
+
+# A chunked upload in progress; `received` bytes have been written to its partial file.
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=200)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)  # declared by the client, checked on completion
+    writing_until = models.DateTimeField(null=True, blank=True)  # lease of the chunk being written
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.size})"
+
 class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='cart')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -74,6 +196,25 @@ class Cart(models.Model):
     class Meta:
         unique_together = ('user', 'product')
 
+# Time-limited hold on stock taken when a product is added to the cart.
+# Product.reserved is the sum of all holds on the product; checkout consumes
+# the hold and the release_expired_reservations command frees stale ones.
+class StockReservation(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} held for {self.user.username}"
+
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_at_idx'),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'در انتظار'),
@@ -93,6 +234,12 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_at_idx'),
+            models.Index(fields=['created_at'], name='order_created_at_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -116,4 +263,8 @@ class Review(models.Model):
         return f"{self.user.username} - {self.product.name} ({self.rating})"
 
     class Meta:
-        unique_together = ('user', 'product') 
\ No newline at end of file
+        unique_together = ('user', 'product') 
+        indexes = [
+            # Table-wide MAX(updated_at) validates list responses (products.conditional).
+            models.Index(fields=['updated_at'], name='review_updated_at_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,39 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class OffsetPagination(LimitOffsetPagination):
+    max_limit = 100
+
+
+# Default pagination: keyset (cursor) pages, so deep pages cost the same as the first one.
+# Views pick the keyset column with `cursor_ordering`. Clients opt into limit/offset pages
+# with `?mode=offset` (admin screens); querysets that already carry an explicit ordering
+# (e.g. search rank) can't be walked by a cursor and use limit/offset as well.
+class KeysetPagination(CursorPagination):
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'mode'
+
+    # The view's cursor_ordering, with the primary key as tiebreaker so rows sharing
+    # a timestamp are neither skipped nor repeated.
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        ordering = (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        if ordering[-1].lstrip('-') not in ('pk', 'id'):
+            ordering += ('-pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.offset_paginator = None
+        if request.query_params.get(self.mode_query_param) == 'offset' or queryset.query.order_by:
+            if not queryset.query.order_by:
+                queryset = queryset.order_by(*self.get_ordering(request, queryset, view))
+            self.offset_paginator = OffsetPagination()
+            return self.offset_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
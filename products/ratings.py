@@ -0,0 +1,76 @@
+from decimal import Decimal
+from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, Review
+
+
+# Product.review_count / rating_sum / avg_rating cover approved reviews only.
+# They are updated with F() deltas whenever a review is created, approved,
+# edited or deleted; reconcile_review_aggregates recomputes them in bulk.
+
+def average(count, total):
+    return Coalesce(
+        Cast(total, models.DecimalField(max_digits=12, decimal_places=4)) / NullIf(count, 0),
+        Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_delta(product_id, count, total):
+    if product_id is None or (count == 0 and total == 0):
+        return
+    Product.objects.filter(pk=product_id).update(
+        review_count=F('review_count') + count,
+        rating_sum=F('rating_sum') + total,
+        avg_rating=average(F('review_count') + count, F('rating_sum') + total),
+    )
+
+
+def contribution(review):
+    return (1, review.rating) if review.is_approved else (0, 0)
+
+
+@receiver(pre_save, sender=Review)
+def remember_counted_review(sender, instance, **kwargs):
+    instance._counted = None
+    if instance.pk:
+        instance._counted = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating', 'is_approved').first()
+
+@receiver(post_save, sender=Review)
+def update_review_aggregates(sender, instance, **kwargs):
+    count, total = contribution(instance)
+    old = getattr(instance, '_counted', None)
+    if old:
+        old_product_id, old_rating, old_approved = old
+        old_count, old_total = (1, old_rating) if old_approved else (0, 0)
+        if old_product_id != instance.product_id:
+            apply_delta(old_product_id, -old_count, -old_total)
+        else:
+            count, total = count - old_count, total - old_total
+    apply_delta(instance.product_id, count, total)
+
+@receiver(post_delete, sender=Review)
+def remove_review_aggregates(sender, instance, **kwargs):
+    count, total = contribution(instance)
+    apply_delta(instance.product_id, -count, -total)
+
+
+# Recomputes the aggregates from the approved reviews, in pk-ordered batches of products.
+def reconcile(batch_size=1000):
+    approved = Review.objects.filter(product=OuterRef('pk'), is_approved=True).order_by().values('product')
+    review_count = Coalesce(Subquery(approved.annotate(n=Count('pk')).values('n')), 0)
+    rating_sum = Coalesce(Subquery(approved.annotate(total=Sum('rating')).values('total')), 0)
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return updated
+        batch = Product.objects.filter(pk__in=pks)
+        batch.update(review_count=review_count, rating_sum=rating_sum)
+        updated += batch.update(avg_rating=average(F('review_count'), F('rating_sum')))
+        last_pk = pks[-1]
@@ -0,0 +1,24 @@
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.dispatch import receiver
+from pulse_shop.renditions import register, rendered
+from .cache import invalidate_catalog
+from .models import Category, Product, ProductImage
+
+# Catalog images that get renditions (see pulse_shop.renditions).
+
+register(Product, 'main_image')
+register(ProductImage, 'image')
+register(Category, 'image')
+
+
+# Stored renditions turn a row's `*_renditions` from null into URLs without
+# changing the row: touch the rows showing the image (and the products rendering
+# them) so their ETags change, and drop the cached catalog responses.
+@receiver(rendered)
+def touch_rendered(sender, name, **kwargs):
+    images = ProductImage.objects.filter(image=name)
+    Product.objects.filter(Q(main_image=name) | Q(pk__in=images.values('product_id'))).update(updated_at=Now())
+    images.update(updated_at=Now())
+    Category.objects.filter(image=name).update(updated_at=Now())
+    invalidate_catalog()
@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F
+
+
+# Weighted document used for product full-text search; stored in Product.search_vector.
+# Keep in sync with the trigger function in migrations/0007_product_search_vector_trigger.py.
+def product_search_vector():
+    return (SearchVector('name', weight='A') +
+            SearchVector('short_description', weight='B') +
+            SearchVector('long_description', weight='C'))
+
+
+# Ranks products against the stored (GIN indexed) search_vector column.
+# The `search_vector=query` filter is what lets the planner use the index;
+# ranking is only computed for the rows it returns.
+def search_products(queryset, search_query, min_rank=0.1):
+    query = SearchQuery(search_query)
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).filter(rank__gte=min_rank).order_by('-rank', '-pk')
+
+
+# Recomputes search_vector for the given queryset in pk-ordered batches.
+def refresh_search_vectors(queryset, batch_size=1000):
+    from .models import Product
+
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return updated
+        updated += Product.objects.filter(pk__in=pks).update(search_vector=product_search_vector())
+        last_pk = pks[-1]
+
+
+# Switches the search_vector trigger into deferred mode for bulk imports.
+# Rows written inside the block get an empty vector and are refreshed in
+# batches when the block exits, in the same transaction.
+@contextmanager
+def deferred_search_vectors(batch_size=1000):
+    from .models import Product
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('products.defer_search_vector', 'on', true)")
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('products.defer_search_vector', 'off', true)")
+        refresh_search_vectors(Product.objects.filter(search_vector__isnull=True), batch_size=batch_size)
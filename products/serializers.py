@@ -1,18 +1,47 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Category, Product, ProductImage, FileManager, Cart, Order, OrderItem, Review
+from pulse_shop.renditions import RenditionsField
+from .models import Category, Product, ProductImage, FileManager, UploadSession, Cart, Order, OrderItem, Review
+from .files import store_upload
 
 
+# Lets GET clients trim the top-level representation with `?fields=id,name,...`.
+# Nested uses of the serializer (e.g. the product of a cart line) are left alone.
+class SparseFieldsetMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        is_root = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        if request is None or request.method != 'GET' or not is_root:
+            return fields
+        requested = request.query_params.get('fields')
+        if requested:
+            keep = set(requested.split(','))
+            fields = {name: field for name, field in fields.items() if name in keep}
+        return fields
+
 class CategorySerializer(serializers.HyperlinkedModelSerializer):
     children = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name='category-detail')
+    image_renditions = RenditionsField(source='image')
 
     class Meta:
         model = Category
-        fields = ['id', 'url', 'name', 'parent', 'children', 'image', 'is_active']
+        fields = ['id', 'url', 'name', 'parent', 'children', 'image', 'image_renditions', 'is_active', 'depth']
+        read_only_fields = ['depth']
+
+    def validate_parent(self, parent):
+        if self.instance and parent and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("دسته نمی‌تواند زیرمجموعه خودش باشد")
+        if parent and not (self.instance or Category()).fits_under(parent):
+            raise serializers.ValidationError("عمق دسته‌بندی بیش از حد مجاز است")
+        return parent
 
 class ProductImageSerializer(serializers.HyperlinkedModelSerializer):
+    image_renditions = RenditionsField(source='image')
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'url', 'product', 'image', 'is_main']
+        fields = ['id', 'url', 'product', 'image', 'image_renditions', 'is_main']
 
 class ReviewSerializer(serializers.HyperlinkedModelSerializer):
     user = serializers.HyperlinkedRelatedField(view_name='customuser-detail', read_only=True)
@@ -26,20 +55,79 @@ class ReviewSerializer(serializers.HyperlinkedModelSerializer):
             'url': {'view_name': 'review-detail', 'lookup_field': 'pk'}
         }
 
-class ProductSerializer(serializers.HyperlinkedModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
     category = serializers.HyperlinkedRelatedField(view_name='category-detail', queryset=Category.objects.all())
     images = ProductImageSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
+    available_stock = serializers.IntegerField(read_only=True)
+    main_image_renditions = RenditionsField(source='main_image')
+
+    class Meta:
+        model = Product
+        fields = ['id', 'url', 'sku', 'name', 'price', 'stock', 'available_stock', 'discount', 'brand', 'size', 'color', 
+                  'is_active', 'short_description', 'long_description', 'category', 'main_image', 'main_image_renditions',
+                  'images', 'reviews',
+                  'review_count', 'avg_rating']
+        read_only_fields = ['review_count', 'avg_rating']
+
+# Compact representation for product listings; the nested images/reviews and the
+# description columns are only rendered (and fetched) on detail.
+class ProductListSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
+    in_stock = serializers.SerializerMethodField()
+    main_image_renditions = RenditionsField(source='main_image')
+
+    # Columns loaded for a list page (see ProductViewSet.get_queryset).
+    queryset_fields = ['id', 'name', 'price', 'discount', 'stock', 'reserved', 'main_image', 'review_count', 'avg_rating']
 
     class Meta:
         model = Product
-        fields = ['id', 'url', 'name', 'price', 'stock', 'discount', 'brand', 'size', 'color', 
-                  'is_active', 'short_description', 'long_description', 'category', 'main_image', 'images', 'reviews']
+        fields = ['id', 'url', 'name', 'price', 'discount', 'in_stock', 'main_image', 'main_image_renditions',
+                  'review_count', 'avg_rating']
+        read_only_fields = fields
+
+    def get_in_stock(self, obj):
+        return obj.available_stock > 0
 
 class FileManagerSerializer(serializers.HyperlinkedModelSerializer):
+    download = serializers.HyperlinkedIdentityField(view_name='filemanager-download')
+
     class Meta:
         model = FileManager
-        fields = ['id', 'url', 'name', 'file', 'uploaded_at', 'is_active']
+        fields = ['id', 'url', 'name', 'file', 'download', 'size', 'content_hash', 'uploaded_at', 'is_active']
+        read_only_fields = ['size', 'content_hash']
+
+    def create(self, validated_data):
+        return super().create(self.stored(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.stored(validated_data))
+
+    # Uploaded content is stored once per hash (see products.files).
+    def stored(self, validated_data):
+        if 'file' in validated_data:
+            validated_data.update(store_upload(validated_data['file']))
+        return validated_data
+
+# Starts a chunked upload; `sha256` (optional) lets already stored content skip the transfer.
+class UploadStartSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    size = serializers.IntegerField(min_value=0)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, default='')
+
+    def validate_size(self, size):
+        if size > settings.FILE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError("حجم فایل بیش از حد مجاز است")
+        return size
+
+    def validate_sha256(self, sha256):
+        return sha256.lower()
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'name', 'size', 'offset', 'created_at']
 
 class CartSerializer(serializers.HyperlinkedModelSerializer):
     product = ProductSerializer(read_only=True)
@@ -49,7 +137,8 @@ class CartSerializer(serializers.HyperlinkedModelSerializer):
         model = Cart
         fields = ['id', 'url', 'user', 'product', 'product_id', 'quantity', 'created_at']
         extra_kwargs = {
-            'url': {'view_name': 'cart-detail', 'lookup_field': 'pk'}
+            'url': {'view_name': 'cart-detail', 'lookup_field': 'pk'},
+            'user': {'read_only': True, 'default': serializers.CurrentUserDefault()}
         }
 
 class OrderItemSerializer(serializers.HyperlinkedModelSerializer):
@@ -68,4 +157,16 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['id', 'url', 'user', 'created_at', 'updated_at', 'total_price', 'status', 'shipping_address', 'items']
         extra_kwargs = {
             'url': {'view_name': 'order-detail', 'lookup_field': 'pk'}
-        }
\ No newline at end of file
+        }
+
+# One row of a bulk product import (see products.importexport). `sku` is the upsert
+# key, so its unique check is left to the database; `category` is a category name,
+# resolved once per chunk rather than per row.
+class ProductImportSerializer(serializers.ModelSerializer):
+    sku = serializers.CharField(max_length=64)
+    category = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    class Meta:
+        model = Product
+        fields = ['sku', 'name', 'price', 'stock', 'discount', 'brand', 'size', 'color', 'is_active',
+                  'short_description', 'long_description', 'category']
@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from accounts.models import CustomUser
+from accounts.tokens import issue_pair
+from pulse_shop.postgresql.stats import checkout_stats, flush, record_checkout, reset_stats
+from pulse_shop.renditions import rendition_name, rendition_names
+from .models import (Category, Product, ProductImage, FileManager, UploadSession, Cart, StockReservation, Order,
+                     OrderItem, Review)
+from .search import product_search_vector, deferred_search_vectors
+from .checkout import checkout, CheckoutError
+from .reservations import reserve, release_expired, ReservationError
+from .cache import catalog_cache, cache_stats, invalidate_catalog
+from .ratings import reconcile
+from .importexport import import_products, export_products
+from . import async_views, files
 
-# Create your tests here.
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        self.phone = Product.objects.create(name='Galaxy phone', price=100, short_description='android phone')
+        self.case = Product.objects.create(name='Leather case', price=10, long_description='fits every phone')
+        Product.objects.create(name='Desk lamp', price=20)
+
+    def test_search_uses_stored_vector_and_orders_by_rank(self):
+        response = self.client.get('/api/products/products/', {'search': 'phone'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.phone.id, self.case.id])
+
+    def test_search_ignores_products_without_vector(self):
+        Product.objects.filter(pk=self.phone.pk).update(search_vector=None)
+        response = self.client.get('/api/products/products/', {'search': 'galaxy'})
+        self.assertEqual(response.data['results'], [])
+
+
+class BackfillSearchVectorsTests(TestCase):
+    def test_backfills_empty_vectors_in_batches(self):
+        products = [Product.objects.create(name=f'Shirt {i}', price=1) for i in range(5)]
+        Product.objects.update(search_vector=None)
+        call_command('backfill_search_vectors', batch_size=2, stdout=StringIO())
+        self.assertFalse(Product.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(Product.objects.filter(search_vector='shirt').count(), len(products))
+
+
+class SearchVectorMaintenanceTests(TestCase):
+    def assertVectorsCurrent(self):
+        rows = Product.objects.annotate(expected=product_search_vector()).values_list('search_vector', 'expected')
+        for stored, expected in rows:
+            self.assertIsNotNone(stored)
+            self.assertEqual(stored, expected)
+
+    def test_single_and_bulk_writes_produce_same_vector(self):
+        single = Product.objects.create(name='Red shoe', price=1, short_description='running', long_description='light')
+        bulk, = Product.objects.bulk_create([
+            Product(name='Red shoe', price=1, short_description='running', long_description='light'),
+        ])
+        single.refresh_from_db()
+        bulk.refresh_from_db()
+        self.assertEqual(single.search_vector, bulk.search_vector)
+        self.assertVectorsCurrent()
+
+    def test_bulk_update_and_queryset_update_refresh_vector(self):
+        products = Product.objects.bulk_create([Product(name=f'Item {i}', price=1) for i in range(3)])
+        for product in products:
+            product.short_description = 'waterproof jacket'
+        Product.objects.bulk_update(products, ['short_description'])
+        Product.objects.filter(pk=products[0].pk).update(long_description='winter hiking')
+        self.assertVectorsCurrent()
+        self.assertEqual(Product.objects.filter(search_vector='hiking').count(), 1)
+
+    def test_price_only_update_keeps_vector(self):
+        product = Product.objects.create(name='Blue hat', price=1)
+        Product.objects.filter(pk=product.pk).update(price=2)
+        self.assertVectorsCurrent()
+
+    def test_deferred_mode_refreshes_once_on_exit(self):
+        with deferred_search_vectors(batch_size=2):
+            Product.objects.bulk_create([Product(name=f'Scarf {i}', price=1) for i in range(5)])
+            self.assertEqual(Product.objects.filter(search_vector__isnull=True).count(), 5)
+        self.assertVectorsCurrent()
+
+
+def make_user(username, **extra):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com',
+                                          mobile_number=f'0912{CustomUser.objects.count():07d}',
+                                          password='pass1234', **extra)
+
+
+# Asserts that a listing endpoint runs the same number of queries whatever the number of rows.
+class QueryCountMixin:
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def assertListQueriesConstant(self, url, add_rows):
+        add_rows()
+        before = self.count_queries(url)
+        add_rows()
+        add_rows()
+        after = self.count_queries(url)
+        self.assertEqual(len(after), len(before), '\n'.join(query['sql'] for query in after.captured_queries))
+
+
+class ListingQueryCountTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user('buyer')
+        self.reviewer = make_user('reviewer')
+        self.category = Category.objects.create(name='Shoes')
+        self.client.force_authenticate(self.user)
+
+    def add_product(self):
+        product = Product.objects.create(name='Sneaker', price=10, stock=5, category=self.category)
+        ProductImage.objects.create(product=product, image='product_images/a.jpg')
+        ProductImage.objects.create(product=product, image='product_images/b.jpg')
+        Review.objects.create(user=self.reviewer, product=product, rating=4, is_approved=True)
+        Review.objects.create(user=self.user, product=product, rating=2)
+        return product
+
+    def test_product_list(self):
+        self.assertListQueriesConstant('/api/products/products/', self.add_product)
+
+    def test_product_list_for_staff(self):
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        self.assertListQueriesConstant('/api/products/products/', self.add_product)
+
+    def test_category_list(self):
+        def add_category():
+            parent = Category.objects.create(name=f'Parent {Category.objects.count()}')
+            Category.objects.create(name=f'Child {Category.objects.count()}', parent=parent)
+        self.assertListQueriesConstant('/api/products/categories/', add_category)
+
+    def test_cart_list(self):
+        self.assertListQueriesConstant('/api/products/cart/', lambda: Cart.objects.create(user=self.user, product=self.add_product()))
+
+    def test_order_list(self):
+        def add_order():
+            order = Order.objects.create(user=self.user, total_price=20, shipping_address='Tehran')
+            for _ in range(2):
+                OrderItem.objects.create(order=order, product=self.add_product(), quantity=1, price=10)
+        self.assertListQueriesConstant('/api/products/orders/', add_order)
+        self.assertListQueriesConstant('/api/products/order-items/', add_order)
+
+    def test_review_list(self):
+        self.assertListQueriesConstant('/api/products/reviews/', lambda: Review.objects.create(
+            user=self.user, product=Product.objects.create(name='Boot', price=1), rating=5))
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.products = [Product.objects.create(name=f'Shirt {i}', price=1) for i in range(5)]
+
+    def test_products_use_keyset_pages_newest_first(self):
+        response = self.client.get('/api/products/products/', {'page_size': 2})
+        seen = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [row['id'] for row in response.data['results']]
+        self.assertEqual(seen, [product.id for product in reversed(self.products)])
+        self.assertNotIn('count', response.data)
+
+    def test_next_link_does_not_reload_rows(self):
+        catalog_cache().clear()
+        with self.assertNumQueries(2):  # validator + page
+            response = self.client.get('/api/products/products/', {'page_size': 2})
+        self.assertIsNotNone(response.data['next'])
+
+    def test_offset_mode(self):
+        response = self.client.get('/api/products/products/', {'mode': 'offset', 'limit': 2, 'offset': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('mode=offset', response.data['next'])
+
+    def test_rows_sharing_a_timestamp_are_paged_once(self):
+        Product.objects.update(created_at=timezone.now())
+        expected = sorted((product.id for product in self.products), reverse=True)
+        response = self.client.get('/api/products/products/', {'page_size': 2})
+        seen = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [row['id'] for row in response.data['results']]
+        self.assertEqual(seen, expected)
+        seen = [row['id'] for offset in range(0, 5, 2) for row in self.client.get(
+            '/api/products/products/', {'mode': 'offset', 'limit': 2, 'offset': offset}).data['results']]
+        self.assertEqual(seen, expected)
+
+    def test_equal_ratings_are_paged_once(self):
+        seen = [row['id'] for offset in range(0, 5, 2) for row in self.client.get(
+            '/api/products/products/', {'ordering': '-avg_rating', 'limit': 2, 'offset': offset}).data['results']]
+        self.assertEqual(seen, sorted((product.id for product in self.products), reverse=True))
+
+    def test_search_results_fall_back_to_offset_pages(self):
+        response = self.client.get('/api/products/products/', {'search': 'shirt'})
+        self.assertEqual(response.data['count'], 5)
+
+
+class CheckoutTests(APITestCase):
+    def setUp(self):
+        self.user = make_user('buyer')
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count, stock=5):
+        for i in range(count):
+            product = Product.objects.create(name=f'Shirt {i}', price=10, stock=stock)
+            Cart.objects.create(user=self.user, product=product, quantity=2)
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        self.fill_cart(2)
+        response = self.client.post('/api/products/orders/', {'shipping_address': 'Tehran'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '40.00')
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [3, 3])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_insufficient_stock_rolls_back(self):
+        self.fill_cart(1)
+        self.fill_cart(1, stock=1)
+        response = self.client.post('/api/products/orders/', {'shipping_address': 'Tehran'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertEqual(sorted(Product.objects.values_list('stock', flat=True)), [1, 5])
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, 'Tehran')
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(2)
+        with CaptureQueriesContext(connection) as small:
+            checkout(self.user, 'Tehran')
+        self.fill_cart(8)
+        with CaptureQueriesContext(connection) as large:
+            checkout(self.user, 'Tehran')
+        self.assertEqual(len(small), len(large))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_parallel_checkouts_never_oversell(self):
+        product = Product.objects.create(name='Limited sneaker', price=10, stock=5)
+        buyers = [make_user(f'buyer{i}') for i in range(12)]
+        for buyer in buyers:
+            Cart.objects.create(user=buyer, product=product, quantity=1)
+        errors = []
+
+        def buy(buyer):
+            try:
+                checkout(buyer, 'Tehran')
+            except CheckoutError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(len(errors), 7)
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.user = make_user('buyer')
+        self.other = make_user('other')
+        self.product = Product.objects.create(name='Flash sale phone', price=100, stock=3)
+        self.client.force_authenticate(self.user)
+
+    def test_cart_add_holds_stock(self):
+        response = self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reserved, self.product.available_stock), (2, 1))
+        response = self.client.get(f'/api/products/products/{self.product.id}/')
+        self.assertEqual(response.data['available_stock'], 1)
+
+    def test_adding_same_product_twice_is_rejected(self):
+        self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 1})
+        response = self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cannot_hold_more_than_available(self):
+        reserve(self.other, self.product, 2)
+        response = self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_update_and_remove_adjust_hold(self):
+        self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 1})
+        item = Cart.objects.get(user=self.user)
+        self.client.patch(f'/api/products/cart/{item.id}/', {'quantity': 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 3)
+        self.client.delete(f'/api/products/cart/{item.id}/')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_changing_product_releases_old_hold(self):
+        other_product = Product.objects.create(name='Flash sale watch', price=50, stock=3)
+        self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 2})
+        item = Cart.objects.get(user=self.user)
+        response = self.client.patch(f'/api/products/cart/{item.id}/', {'product_id': other_product.id})
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertEqual((self.product.reserved, other_product.reserved), (0, 2))
+        self.assertEqual(list(StockReservation.objects.values_list('product_id', flat=True)), [other_product.id])
+
+    def test_checkout_consumes_hold(self):
+        self.client.post('/api/products/cart/', {'product_id': self.product.id, 'quantity': 3})
+        response = self.client.post('/api/products/orders/', {'shipping_address': 'Tehran'})
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_respects_other_users_holds(self):
+        reserve(self.other, self.product, 2)
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, 'Tehran')
+
+    def test_expired_holds_are_released_in_bulk(self):
+        reserve(self.user, self.product, 1)
+        reserve(self.other, self.product, 2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_expired(batch_size=1), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+
+    def test_release_locks_products_in_checkout_order(self):
+        second = Product.objects.create(name='Second', price=5, stock=5)
+        reserve(self.user, second, 1)
+        reserve(self.user, self.product, 1)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with CaptureQueriesContext(connection) as queries:
+            release_expired()
+        product_sql = [query['sql'] for query in queries if 'products_product' in query['sql'].split('WHERE')[0]]
+        self.assertTrue(product_sql[0].endswith('ORDER BY 1 ASC FOR UPDATE'))
+        self.assertTrue(product_sql[1].startswith('UPDATE'))
+
+    def test_save_does_not_overwrite_reserved(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        reserve(self.user, self.product, 2)
+        stale.price = 90
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.reserved), (90, 2))
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.product = Product.objects.create(name='Cached shoe', price=10)
+
+    def get(self, url, **params):
+        return self.client.get(url, params)
+
+    def test_second_read_is_served_from_cache(self):
+        url = f'/api/products/products/{self.product.id}/'
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):  # the conditional GET validator only
+            response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['name'], 'Cached shoe')
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_query_params_are_normalized(self):
+        self.get('/api/products/products/', brand='x', color='red')
+        self.assertEqual(self.get('/api/products/products/', color='red', brand='x')['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/api/products/products/', color='blue', brand='x')['X-Cache'], 'MISS')
+
+    def test_writes_invalidate_affected_responses(self):
+        other = Product.objects.create(name='Other', price=1)
+        url = f'/api/products/products/{self.product.id}/'
+        self.get(url)
+        self.get(f'/api/products/products/{other.id}/')
+        Review.objects.create(user=make_user('reviewer'), product=self.product, rating=5, is_approved=True)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['reviews']), 1)
+        self.assertEqual(self.get(f'/api/products/products/{other.id}/')['X-Cache'], 'HIT')
+
+        self.product.name = 'Renamed shoe'
+        self.product.save()
+        self.assertEqual(self.get(url).data['name'], 'Renamed shoe')
+
+    def test_staff_and_public_are_cached_separately(self):
+        Review.objects.create(user=make_user('reviewer'), product=self.product, rating=1)
+        url = f'/api/products/products/{self.product.id}/'
+        self.assertEqual(self.get(url).data['reviews'], [])
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['reviews']), 1)
+
+    def test_bulk_writes_can_invalidate_everything(self):
+        self.get('/api/products/categories/')
+        Product.objects.update(price=5)
+        invalidate_catalog()
+        self.assertEqual(self.get('/api/products/categories/')['X-Cache'], 'MISS')
+
+
+class CategoryTreeTests(APITestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.clothes = Category.objects.create(name='Clothes')
+        self.men = Category.objects.create(name='Men', parent=self.clothes)
+        self.shirts = Category.objects.create(name='Shirts', parent=self.men)
+        self.toys = Category.objects.create(name='Toys')
+
+    def test_paths_follow_the_tree(self):
+        self.shirts.refresh_from_db()
+        self.assertEqual(self.shirts.path, f'{self.clothes.pk:010d}/{self.men.pk:010d}/{self.shirts.pk:010d}/')
+        self.assertEqual(self.shirts.depth, 2)
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.men.parent = self.toys
+        self.men.save()
+        self.shirts.refresh_from_db()
+        self.assertTrue(self.shirts.path.startswith(self.toys.path))
+        self.assertEqual(self.shirts.depth, 2)
+        self.assertEqual(set(self.toys.get_descendants()), {self.toys, self.men, self.shirts})
+
+    def test_cannot_move_under_own_descendant(self):
+        response = self.client.patch(f'/api/products/categories/{self.clothes.id}/', {'parent': f'http://testserver/api/products/categories/{self.shirts.id}/'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_nesting_is_limited_to_what_path_can_hold(self):
+        parent = self.shirts
+        while parent.depth < Category.MAX_DEPTH:
+            parent = Category.objects.create(name=f'Level {parent.depth + 1}', parent=parent)
+        url = f'http://testserver/api/products/categories/{parent.id}/'
+        response = self.client.post('/api/products/categories/', {'name': 'Too deep', 'parent': url})
+        self.assertEqual(response.status_code, 400)
+        # Moving a subtree counts its own depth too.
+        games = Category.objects.create(name='Games', parent=self.toys)
+        response = self.client.patch(f'/api/products/categories/{self.men.id}/',
+                                     {'parent': f'http://testserver/api/products/categories/{games.id}/'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tree_endpoint_returns_active_tree_in_one_query(self):
+        Category.objects.create(name='Hidden', parent=self.clothes, is_active=False)
+        with self.assertNumQueries(2):  # validator + tree
+            response = self.client.get('/api/products/categories/tree/')
+        self.assertEqual([node['name'] for node in response.data], ['Clothes', 'Toys'])
+        self.assertEqual(response.data[0]['children'][0]['name'], 'Men')
+        self.assertEqual(response.data[0]['children'][0]['children'][0]['name'], 'Shirts')
+        self.assertEqual(len(response.data[0]['children']), 1)
+
+    def test_filter_products_by_category_subtree(self):
+        shirt = Product.objects.create(name='Shirt', price=1, category=self.shirts)
+        jacket = Product.objects.create(name='Jacket', price=1, category=self.men)
+        Product.objects.create(name='Ball', price=1, category=self.toys)
+        response = self.client.get('/api/products/products/', {'category_subtree': self.clothes.id})
+        self.assertEqual({row['id'] for row in response.data['results']}, {shirt.id, jacket.id})
+
+
+class ReviewAggregateTests(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Rated shoe', price=10)
+        self.users = [make_user(f'reviewer{i}') for i in range(3)]
+
+    def assertAggregates(self, product, count, total, average):
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.rating_sum, product.avg_rating), (count, total, Decimal(average)))
+
+    def test_only_approved_reviews_are_counted(self):
+        Review.objects.create(user=self.users[0], product=self.product, rating=5, is_approved=True)
+        Review.objects.create(user=self.users[1], product=self.product, rating=4, is_approved=True)
+        Review.objects.create(user=self.users[2], product=self.product, rating=1)
+        self.assertAggregates(self.product, 2, 9, '4.50')
+
+    def test_approve_edit_move_and_delete(self):
+        review = Review.objects.create(user=self.users[0], product=self.product, rating=2)
+        self.assertAggregates(self.product, 0, 0, '0')
+        review.is_approved = True
+        review.save()
+        self.assertAggregates(self.product, 1, 2, '2.00')
+        review.rating = 3
+        review.save()
+        self.assertAggregates(self.product, 1, 3, '3.00')
+        other = Product.objects.create(name='Other', price=1)
+        review.product = other
+        review.save()
+        self.assertAggregates(self.product, 0, 0, '0')
+        self.assertAggregates(other, 1, 3, '3.00')
+        review.delete()
+        self.assertAggregates(other, 0, 0, '0')
+
+    def test_reconcile_fixes_drift(self):
+        Review.objects.create(user=self.users[0], product=self.product, rating=5, is_approved=True)
+        Review.objects.filter(product=self.product).update(rating=1)
+        Review.objects.create(user=self.users[1], product=self.product, rating=4)
+        Review.objects.filter(product=self.product).update(is_approved=True)
+        reconcile(batch_size=1)
+        self.assertAggregates(self.product, 2, 5, '2.50')
+
+    def test_min_rating_filter_and_rating_ordering(self):
+        best = Product.objects.create(name='Best', price=1)
+        Review.objects.create(user=self.users[0], product=best, rating=5, is_approved=True)
+        Review.objects.create(user=self.users[1], product=self.product, rating=3, is_approved=True)
+        Product.objects.create(name='Unrated', price=1)
+        response = self.client.get('/api/products/products/', {'min_rating': 3, 'ordering': '-avg_rating'})
+        self.assertEqual([row['id'] for row in response.data['results']], [best.id, self.product.id])
+        self.assertEqual(response.data['results'][0]['avg_rating'], '5.00')
+
+
+class ProductListRepresentationTests(APITestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.product = Product.objects.create(name='Light shoe', price=10, stock=1, long_description='x' * 5000)
+        ProductImage.objects.create(product=self.product, image='product_images/a.jpg')
+
+    def test_list_is_compact_and_skips_heavy_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/products/')
+        row = response.data['results'][0]
+        self.assertEqual(set(row), {'id', 'url', 'name', 'price', 'discount', 'in_stock', 'main_image', 'main_image_renditions',
+                                    'review_count', 'avg_rating'})
+        self.assertTrue(row['in_stock'])
+        self.assertEqual(len(queries), 2)  # validator + page
+        self.assertNotIn('long_description', queries[1]['sql'])
+
+    def test_detail_keeps_full_representation(self):
+        response = self.client.get(f'/api/products/products/{self.product.id}/')
+        self.assertEqual(len(response.data['images']), 1)
+        self.assertIn('long_description', response.data)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/products/products/', {'fields': 'id,name'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+        response = self.client.get(f'/api/products/products/{self.product.id}/', {'fields': 'id,images'})
+        self.assertEqual(set(response.data), {'id', 'images'})
+
+    def test_sparse_fieldsets_do_not_trim_nested_products(self):
+        user = make_user('buyer')
+        Cart.objects.create(user=user, product=self.product)
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/products/cart/', {'fields': 'id'})
+        self.assertIn('long_description', response.data['results'][0]['product'])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.category = Category.objects.create(name='Shoes')
+        self.product = Product.objects.create(name='Runner', price=10, stock=5, category=self.category)
+        self.detail = f'/api/products/products/{self.product.pk}/'
+
+    def etag(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_detail_is_answered_with_304_from_one_query(self):
+        response = self.client.get(self.detail)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.detail, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertNotIn('X-Cache', not_modified)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_writes_on_every_path_change_the_detail_etag(self):
+        etag = self.etag(self.detail)
+        Product.objects.filter(pk=self.product.pk).update(reserved=F('reserved') + 1)
+        self.assertNotEqual(self.etag(self.detail), etag)
+        etag = self.etag(self.detail)
+        image = ProductImage.objects.create(product=self.product, image='product_images/a.jpg')
+        self.assertNotEqual(self.etag(self.detail), etag)
+        etag = self.etag(self.detail)
+        image.delete()
+        self.assertNotEqual(self.etag(self.detail), etag)
+        etag = self.etag(self.detail)
+        Review.objects.create(user=make_user('critic'), product=self.product, rating=2)
+        self.assertNotEqual(self.etag(self.detail), etag)
+
+    def test_list_etag_follows_updates_and_deletions(self):
+        other = Product.objects.create(name='Walker', price=12)
+        url = '/api/products/products/'
+        etag = self.etag(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.etag(url, data={'brand': 'x'}), etag)
+        other.delete()
+        self.assertNotEqual(self.etag(url), etag)
+        etag = self.etag(url)
+        Product.objects.filter(pk=self.product.pk).update(price=11)
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_row_leaving_a_filtered_list_changes_its_etag(self):
+        Product.objects.filter(pk=self.product.pk).update(brand='Nike')
+        # The newest row stays in the list; the older one leaves it.
+        Product.objects.create(name='Walker', price=12, brand='Nike')
+        url = '/api/products/products/'
+        etag = self.etag(url, data={'brand': 'Nike'})
+        self.product.brand = 'Puma'
+        self.product.save()
+        response = self.client.get(url, {'brand': 'Nike'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data['results']], ['Walker'])
+
+    def test_review_list_etags_are_per_user(self):
+        self.client.force_authenticate(make_user('reader'))
+        etag = self.etag('/api/products/reviews/')
+        self.client.force_authenticate(make_user('other'))
+        self.assertNotEqual(self.etag('/api/products/reviews/'), etag)
+
+    def test_staff_and_public_representations_have_different_etags(self):
+        public = self.etag(self.detail)
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        self.assertNotEqual(self.etag(self.detail), public)
+
+    def test_category_detail_follows_its_children(self):
+        url = f'/api/products/categories/{self.category.pk}/'
+        etag = self.etag(url)
+        child = Category.objects.create(name='Running', parent=self.category)
+        self.assertNotEqual(self.etag(url), etag)
+        etag = self.etag(url)
+        child.delete()
+        self.assertNotEqual(self.etag(url), etag)
+        self.assertEqual(self.client.get('/api/products/categories/x/').status_code, 404)
+        tree = self.etag('/api/products/categories/tree/')
+        self.assertEqual(self.client.get('/api/products/categories/tree/', HTTP_IF_NONE_MATCH=tree).status_code, 304)
+
+
+class BenchmarkCatalogCommandTests(TestCase):
+    def test_seeds_and_reports_every_filter_mix(self):
+        out = StringIO()
+        call_command('benchmark_catalog', seed=50, repeat=1, plans=True, stdout=out)
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertFalse(Product.objects.filter(search_vector__isnull=True).exists())
+        self.assertIn('category subtree + price', out.getvalue())
+        self.assertIn('Execution Time', out.getvalue())
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        for brand, color, price in [('Nike', 'Red', 50), ('nike', 'Blue', 150), ('Adidas', 'Red', 300), ('Puma', 'Red', 3000)]:
+            Product.objects.create(name=f'{brand} running shoe', brand=brand, color=color, price=price)
+        Product.objects.create(name='Plain lamp', price=20)
+
+    def facets(self, **params):
+        return self.client.get('/api/products/products/facets/', params).data
+
+    def test_counts_for_whole_catalog(self):
+        data = self.facets()
+        self.assertEqual(data['brand'], [{'value': 'Nike', 'count': 2}, {'value': 'Adidas', 'count': 1}, {'value': 'Puma', 'count': 1}])
+        self.assertEqual(data['color'][0], {'value': 'Red', 'count': 3})
+        self.assertEqual(data['size'], [])
+        self.assertEqual([bucket['count'] for bucket in data['price']], [2, 1, 1, 0, 0, 1])
+        self.assertEqual(data['price'][-1], {'min': 2500, 'max': None, 'count': 1})
+
+    def test_each_facet_ignores_its_own_filter(self):
+        data = self.facets(brand='nike', color='red')
+        self.assertEqual(data['brand'], [{'value': 'Adidas', 'count': 1}, {'value': 'Nike', 'count': 1}, {'value': 'Puma', 'count': 1}])
+        self.assertEqual(data['color'], [{'value': 'Blue', 'count': 1}, {'value': 'Red', 'count': 1}])
+        self.assertEqual(sum(bucket['count'] for bucket in data['price']), 1)
+
+    def test_invalid_filter_values_are_rejected_like_the_list(self):
+        response = self.client.get('/api/products/products/facets/', {'min_price': 'abc'})
+        listing = self.client.get('/api/products/products/', {'min_price': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, listing.data)
+
+    def test_counts_follow_search_and_are_cached(self):
+        self.assertEqual(sum(bucket['count'] for bucket in self.facets(search='shoe')['price']), 4)
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/products/facets/', {'search': 'shoe'})
+
+
+class ProductImportExportTests(APITestCase):
+    CSV = (
+        'sku,name,price,stock,brand,category\n'
+        'A-1,Red shirt,10,5,Nike,Clothes\n'
+        'A-2,Blue shirt,not-a-price,5,Nike,Clothes\n'
+        'A-3,Green hat,12,,,Nowhere\n'
+        'A-4,Desk lamp,30,1,,\n'
+    )
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Clothes')
+
+    def test_upserts_by_sku_and_reports_bad_rows(self):
+        existing = Product.objects.create(sku='A-1', name='Old shirt', price=1, reserved=2, review_count=3)
+        report = import_products(BytesIO(self.CSV.encode()), 'csv', batch_size=2)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([error['line'] for error in report.errors], [3, 4])
+        self.assertIn('price', report.errors[0]['errors'])
+        self.assertIn('category', report.errors[1]['errors'])
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price, existing.category, existing.stock), ('Red shirt', 10, self.category, 5))
+        self.assertEqual((existing.reserved, existing.review_count), (2, 3))
+        self.assertEqual(Product.objects.get(sku='A-4').category, None)
+        self.assertFalse(Product.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(self.client.get('/api/products/products/', {'search': 'lamp'}).data['results'][0]['name'], 'Desk lamp')
+
+    def test_partial_feed_only_updates_its_columns(self):
+        existing = Product.objects.create(sku='A-1', name='Old shirt', price=1, stock=7, brand='Nike',
+                                          long_description='Cotton', is_active=False, category=self.category)
+        report = import_products(BytesIO(b'sku,price\nA-1,25\nA-9,30\n'), 'csv')
+        self.assertEqual(report.imported, 1)
+        self.assertIn('name', report.errors[0]['errors'])  # a new product needs its required columns
+        existing.refresh_from_db()
+        self.assertEqual(existing.price, 25)
+        self.assertEqual((existing.name, existing.stock, existing.brand, existing.long_description,
+                          existing.is_active, existing.category), ('Old shirt', 7, 'Nike', 'Cotton', False, self.category))
+
+    def test_jsonl_import_keeps_last_duplicate_and_reports_invalid_json(self):
+        lines = [
+            '{"sku": "B-1", "name": "Lamp", "price": "5"}',
+            'not json',
+            '{"sku": "B-1", "name": "Better lamp", "price": "6", "is_active": false}',
+        ]
+        report = import_products(BytesIO('\n'.join(lines).encode()), 'jsonl')
+        self.assertEqual((report.imported, report.error_count, report.errors[0]['line']), (1, 1, 2))
+        product = Product.objects.get(sku='B-1')
+        self.assertEqual((product.name, product.is_active), ('Better lamp', False))
+
+    def test_export_round_trips_through_import(self):
+        Product.objects.create(sku='C-1', name='Shirt, long sleeve', price=15, category=self.category)
+        exported = ''.join(export_products('csv'))
+        Product.objects.all().delete()
+        report = import_products(BytesIO(exported.encode()), 'csv')
+        self.assertEqual(report.as_dict(), {'imported': 1, 'failed': 0, 'errors': []})
+        self.assertEqual(Product.objects.get(sku='C-1').category, self.category)
+
+    def test_import_and_export_endpoints_are_admin_only(self):
+        upload = SimpleUploadedFile('products.csv', self.CSV.encode(), content_type='text/csv')
+        self.client.force_authenticate(make_user('shopper'))
+        self.assertEqual(self.client.post('/api/products/products/import/', {'file': upload}).status_code, 403)
+
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        upload.seek(0)
+        response = self.client.post('/api/products/products/import/', {'file': upload})
+        self.assertEqual((response.status_code, response.data['imported'], response.data['failed']), (200, 2, 2))
+
+        response = self.client.get('/api/products/products/export/', {'file_format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['sku'] for row in rows], ['A-1', 'A-4'])
+        self.assertEqual(rows[0]['category'], 'Clothes')
+
+
+class OrderExportTests(APITestCase):
+    def setUp(self):
+        self.buyer = make_user('buyer')
+        self.other = make_user('other')
+        self.shirt = Product.objects.create(name='Shirt, red', price=10)
+        self.hat = Product.objects.create(name='Hat', price=5)
+        self.order = self.make_order(self.buyer, [(self.shirt, 2), (self.hat, 1)])
+        old = self.make_order(self.buyer, [(self.hat, 3)], status='delivered')
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.make_order(self.other, [(self.shirt, 1)])
+
+    def make_order(self, user, lines, status='pending'):
+        order = Order.objects.create(user=user, total_price=0, shipping_address='Tehran', status=status)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                                       for product, quantity in lines])
+        return order
+
+    def export(self, **params):
+        response = self.client.get('/api/products/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_user_exports_own_order_lines_as_csv(self):
+        self.client.force_authenticate(self.buyer)
+        lines = self.export().splitlines()
+        self.assertEqual(lines[0], 'order_id,created_at,status,username,product_id,product_name,quantity,price,line_total')
+        self.assertEqual(len(lines), 4)
+        self.assertIn(f'{self.order.pk},', lines[2])
+        self.assertIn('"Shirt, red",2,10.00,20.00', lines[2])
+
+    def test_staff_export_filters_by_date_and_status(self):
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        rows = [json.loads(line) for line in self.export(file_format='jsonl').splitlines()]
+        self.assertEqual({row['username'] for row in rows}, {'buyer', 'other'})
+        today = timezone.localdate().isoformat()
+        rows = [json.loads(line) for line in self.export(file_format='jsonl', date_from=today, status='pending').splitlines()]
+        self.assertEqual(len(rows), 3)
+        rows = [json.loads(line) for line in self.export(file_format='jsonl', date_to=(timezone.localdate() - timedelta(days=1)).isoformat()).splitlines()]
+        self.assertEqual([(row['status'], row['quantity']) for row in rows], [('delivered', 3)])
+
+    def test_rejects_invalid_filters(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/products/orders/export/', {'date_from': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/orders/export/', {'file_format': 'xlsx'}).status_code, 400)
+
+    def test_rows_are_streamed_by_one_query(self):
+        self.client.force_authenticate(self.buyer)
+        for _ in range(5):
+            self.make_order(self.buyer, [(self.shirt, 1), (self.hat, 1)])
+        response = self.client.get('/api/products/orders/export/')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 14)
+
+
+def image_bytes(size=(2000, 1500), file_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, file_format)
+    return buffer.getvalue()
+
+
+@override_settings(IMAGE_RENDITION_WORKERS=0)
+class RenditionTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        catalog_cache().clear()
+        self.product = Product.objects.create(name='Shoe', price=10)
+
+    def rendition(self, name, size, file_format):
+        path = os.path.join(self.media, rendition_name(name, size, file_format))
+        with Image.open(path) as image:
+            return image.format, image.size
+
+    def test_upload_generates_renditions_after_commit(self):
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        upload = SimpleUploadedFile('shoe.jpg', image_bytes(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/product-images/', {
+                'product': f'http://testserver/api/products/products/{self.product.pk}/', 'image': upload,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        name = ProductImage.objects.get().image.name
+        self.assertEqual(self.rendition(name, 'thumb', 'webp'), ('WEBP', (160, 120)))
+        self.assertEqual(self.rendition(name, 'list', 'jpeg'), ('JPEG', (480, 360)))
+        self.assertEqual(self.rendition(name, 'detail', 'webp'), ('WEBP', (1200, 900)))
+        # The upload's own response predates the renditions; later reads list them.
+        self.assertIsNone(response.data['image_renditions'])
+        image = self.client.get(f'/api/products/product-images/{response.data["id"]}/').data
+        self.assertTrue(image['image_renditions']['list']['webp'].endswith(rendition_name(name, 'list', 'webp')))
+
+    def test_conditional_get_sees_renditions_once_stored(self):
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        detail = f'/api/products/products/{self.product.pk}/'
+        upload = SimpleUploadedFile('shoe.jpg', image_bytes(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(detail, {'main_image': upload}, format='multipart')
+        pending = self.client.get(detail)
+        self.assertIsNone(pending.data['main_image_renditions'])
+        for callback in callbacks:
+            callback()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=pending['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['main_image_renditions'])
+
+    def test_small_and_transparent_images_are_not_upscaled(self):
+        upload = SimpleUploadedFile('logo.png', image_bytes((100, 50), 'PNG'))
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Shoes', image=upload)
+        self.assertEqual(self.rendition(category.image.name, 'detail', 'jpeg'), ('JPEG', (100, 50)))
+
+    def test_saving_without_a_new_upload_renders_nothing(self):
+        with mock.patch('pulse_shop.renditions.schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            self.product.main_image = 'products/existing.jpg'
+            self.product.save()
+            self.product.save()
+        schedule.assert_not_called()
+
+    def test_list_exposes_rendition_urls_once_rendered(self):
+        Product.objects.filter(pk=self.product.pk).update(main_image='products/shoe.jpg')
+        self.assertIsNone(self.client.get('/api/products/products/').data['results'][0]['main_image_renditions'])
+        os.makedirs(os.path.join(self.media, 'products'))
+        open(os.path.join(self.media, rendition_names('products/shoe.jpg')[-1]), 'wb').close()
+        catalog_cache().clear()
+        row = self.client.get('/api/products/products/').data['results'][0]
+        self.assertEqual(row['main_image_renditions']['thumb'], {
+            'webp': 'http://testserver/media/products/shoe.jpg.thumb.webp',
+            'jpeg': 'http://testserver/media/products/shoe.jpg.thumb.jpg',
+        })
+        Product.objects.filter(pk=self.product.pk).update(main_image='')
+        catalog_cache().clear()
+        self.assertIsNone(self.client.get('/api/products/products/').data['results'][0]['main_image_renditions'])
+
+    def test_originals_with_the_same_stem_keep_separate_renditions(self):
+        self.assertNotEqual(rendition_name('products/a.jpg', 'list', 'webp'),
+                            rendition_name('products/a.png', 'list', 'webp'))
+
+    def test_command_backfills_existing_media_in_parallel(self):
+        os.makedirs(os.path.join(self.media, 'products'))
+        with open(os.path.join(self.media, 'products', 'old.jpg'), 'wb') as original:
+            original.write(image_bytes())
+        Product.objects.filter(pk=self.product.pk).update(main_image='products/old.jpg')
+        Product.objects.create(name='Lost', price=1, main_image='products/missing.jpg')
+        out = StringIO()
+        call_command('generate_renditions', workers=2, stdout=out)
+        self.assertIn('1 images rendered, 1 failed', out.getvalue())
+        self.assertEqual(self.rendition('products/old.jpg', 'list', 'webp'), ('WEBP', (480, 360)))
+        out = StringIO()
+        call_command('generate_renditions', workers=2, stdout=out)
+        self.assertIn('0 images rendered, 1 failed', out.getvalue())
+
+
+class FileUploadTests(APITestCase):
+    CONTENT = b'0123456789' * 10
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def start(self, content=CONTENT, **extra):
+        return self.client.post('/api/products/files/uploads/', {'name': 'report.pdf', 'size': len(content), **extra})
+
+    def put_chunk(self, upload_id, first, last, content=CONTENT):
+        return self.client.put(f'/api/products/files/uploads/{upload_id}/', content[first:last + 1],
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(content)}')
+
+    def upload(self, content=CONTENT):
+        upload_id = self.start(content).data['upload']['id']
+        for first in range(0, len(content), 40):
+            response = self.put_chunk(upload_id, first, min(first + 40, len(content)) - 1, content)
+        return response
+
+    def test_chunked_upload_resumes_and_stores_content_by_hash(self):
+        upload_id = self.start().data['upload']['id']
+        self.assertEqual(self.put_chunk(upload_id, 0, 29).data['upload']['offset'], 30)
+        response = self.put_chunk(upload_id, 50, 59)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 30))
+        files._hashers.clear()  # e.g. the next chunk lands on another process
+        self.assertEqual(self.client.get(f'/api/products/files/uploads/{upload_id}/').data['upload']['offset'], 30)
+        response = self.put_chunk(upload_id, 30, 99)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['complete'])
+        digest = hashlib.sha256(self.CONTENT).hexdigest()
+        stored = FileManager.objects.get()
+        self.assertEqual((stored.file.name, stored.content_hash, stored.size), (f'uploads/sha256/{digest[:2]}/{digest}', digest, 100))
+        with stored.file.open('rb') as content:
+            self.assertEqual(content.read(), self.CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'uploads', 'partial')), [])
+
+    def test_known_content_is_not_stored_twice(self):
+        self.upload()
+        self.upload()
+        upload = SimpleUploadedFile('copy.pdf', self.CONTENT)
+        self.assertEqual(self.client.post('/api/products/files/', {'name': 'copy', 'file': upload}).status_code, 201)
+        response = self.start(sha256=hashlib.sha256(self.CONTENT).hexdigest().upper())
+        self.assertTrue(response.data['complete'])
+        self.assertIsNone(response.data['upload'])
+        self.assertEqual(FileManager.objects.count(), 4)
+        self.assertEqual(len(set(FileManager.objects.values_list('file', flat=True))), 1)
+        self.assertEqual(len(os.listdir(os.path.dirname(FileManager.objects.first().file.path))), 1)
+
+    def test_rejects_bad_chunks_and_hash_mismatch(self):
+        upload_id = self.start(sha256='0' * 64).data['upload']['id']
+        self.assertEqual(self.put_chunk(upload_id, 0, 9, self.CONTENT + b'x').status_code, 400)
+        response = self.client.put(f'/api/products/files/uploads/{upload_id}/', b'abc', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        response = self.put_chunk(upload_id, 0, 99)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(FileManager.objects.exists())
+
+    def test_range_downloads(self):
+        file_id = self.upload().data['file']['id']
+        url = f'/api/products/files/{file_id}/download/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('report.pdf', response['Content-Disposition'])
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 10-19/100'))
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), b'56789')
+        response = self.client.get(url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, self.CONTENT))
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=100-').status_code, 416)
+
+    def test_web_server_download_modes(self):
+        stored = self.upload().data['file']
+        with override_settings(FILE_DOWNLOAD_MODE='x-accel'):
+            response = self.client.get(f'/api/products/files/{stored["id"]}/download/')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + FileManager.objects.get().file.name)
+        self.assertEqual(response.content, b'')
+        with override_settings(FILE_DOWNLOAD_MODE='x-sendfile'):
+            response = self.client.get(f'/api/products/files/{stored["id"]}/download/')
+        self.assertEqual(response['X-Sendfile'], FileManager.objects.get().file.path)
+
+    def test_chunk_in_progress_is_leased(self):
+        upload_id = self.start().data['upload']['id']
+        UploadSession.objects.update(writing_until=timezone.now() + timedelta(minutes=1))
+        response = self.put_chunk(upload_id, 0, 29)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 0))
+        # A writer that died leaves its lease to run out.
+        UploadSession.objects.update(writing_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.put_chunk(upload_id, 0, 29).data['upload']['offset'], 30)
+        self.assertIsNone(UploadSession.objects.get().writing_until)
+
+    def test_hash_state_is_bounded(self):
+        with mock.patch('products.files.MAX_HASHERS', 1):
+            for _ in range(2):
+                self.put_chunk(self.start().data['upload']['id'], 0, 29)
+        self.assertEqual(len(files._hashers), 1)
+        files._hashers.clear()
+
+    def test_backfill_hashes_files_stored_before_hashing(self):
+        os.makedirs(os.path.join(self.media, 'uploads'))
+        with open(os.path.join(self.media, 'uploads', 'old.pdf'), 'wb') as old:
+            old.write(self.CONTENT)
+        stored = FileManager.objects.create(name='old.pdf', file='uploads/old.pdf')
+        FileManager.objects.create(name='lost.pdf', file='uploads/lost.pdf')
+        out = StringIO()
+        call_command('backfill_file_hashes', stdout=out)
+        self.assertIn('1 files hashed, 1 missing', out.getvalue())
+        stored.refresh_from_db()
+        self.assertEqual((stored.size, stored.content_hash), (100, hashlib.sha256(self.CONTENT).hexdigest()))
+
+    def test_purge_deletes_stale_sessions(self):
+        upload_id = self.start().data['upload']['id']
+        self.put_chunk(upload_id, 0, 9)
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('purge_stale_uploads', stdout=out)
+        self.assertIn('1 stale uploads deleted', out.getvalue())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'uploads', 'partial')), [])
+
+
+# The async views answer from threads with connections of their own, so their
+# data has to be committed.
+class AsyncCatalogTests(TransactionTestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.clothes = Category.objects.create(name='Clothes')
+        Category.objects.create(name='Shirts', parent=self.clothes)
+        Category.objects.create(name='Hidden', parent=self.clothes, is_active=False)
+        self.shirts = [Product.objects.create(name=f'Blue shirt {i}', price=10 + i, brand='Nike', category=self.clothes)
+                       for i in range(5)]
+        self.product = self.shirts[0]
+        ProductImage.objects.create(product=self.product, image='product_images/a.jpg')
+        self.approved = Review.objects.create(product=self.product, user=make_user('fan'), rating=5, is_approved=True)
+        Review.objects.create(product=self.product, user=make_user('critic'), rating=1)
+
+    def get(self, url, **kwargs):
+        return async_to_sync(self.async_client.get)(url, **kwargs)
+
+    def assertSameAsSync(self, path, params=None, **kwargs):
+        response = self.get(f'/api/products/async/{path}', data=params, **kwargs)
+        expected = self.client.get(f'/api/products/{path}', params, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content.decode().replace('/api/products/async/', '/api/products/')),
+                         expected.json())
+        return response
+
+    def test_product_detail_matches_sync_view(self):
+        response = self.assertSameAsSync(f'products/{self.product.id}/')
+        data = json.loads(response.content)
+        self.assertEqual(len(data['images']), 1)
+        self.assertEqual([review['id'] for review in data['reviews']], [self.approved.id])
+        self.assertSameAsSync(f'products/{self.product.id}/', {'fields': 'id,reviews'})
+
+    def test_staff_token_sees_pending_reviews(self):
+        token = issue_pair(make_user('staff', is_staff=True))['access']
+        response = self.assertSameAsSync(f'products/{self.product.id}/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(len(json.loads(response.content)['reviews']), 2)
+        response = self.get(f'/api/products/async/products/{self.product.id}/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_product_is_404(self):
+        self.assertSameAsSync('products/0/')
+
+    def test_product_list_filters_search_and_pages_like_sync_view(self):
+        response = self.assertSameAsSync('products/', {'page_size': 2, 'brand': 'nike'})
+        next_page = json.loads(response.content)['next'].replace('http://testserver', '')
+        self.assertTrue(next_page.startswith('/api/products/async/products/'))
+        self.assertSameAsSync(next_page.replace('/api/products/async/', ''))
+        self.assertSameAsSync('products/', {'search': 'shirt', 'category_subtree': self.clothes.id})
+        self.assertSameAsSync('products/', {'min_price': 'cheap'})
+
+    def test_category_tree_matches_sync_view(self):
+        response = self.assertSameAsSync('categories/tree/')
+        self.assertEqual([node['name'] for node in json.loads(response.content)], ['Clothes'])
+
+    def test_each_request_runs_on_one_worker_thread(self):
+        threads = []
+        on_connection = async_views.on_connection
+
+        def record(function, *args):
+            threads.append(threading.get_ident())
+            with CaptureQueriesContext(connection) as queries:
+                result = on_connection(function, *args)
+            threads.append(len(queries))
+            return result
+
+        with mock.patch('products.async_views.on_connection', side_effect=record):
+            self.assertEqual(self.get(f'/api/products/async/products/{self.product.id}/').status_code, 200)
+            self.assertEqual(self.get('/api/products/async/products/').status_code, 200)
+        # One call per request, off the event loop's thread; the detail's product,
+        # images and reviews queries share its connection.
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(threading.get_ident(), threads[::2])
+        self.assertEqual(threads[1], 3)
+
+    def test_basic_auth_is_honoured(self):
+        make_user('staff', is_staff=True)
+        basic = 'Basic ' + base64.b64encode(b'staff:pass1234').decode()
+        response = self.assertSameAsSync(f'products/{self.product.id}/', headers={'Authorization': basic})
+        self.assertEqual(len(json.loads(response.content)['reviews']), 2)
+        wrong = 'Basic ' + base64.b64encode(b'staff:wrong').decode()
+        self.assertSameAsSync('products/', headers={'Authorization': wrong})
+
+    def test_writes_are_not_routed(self):
+        response = async_to_sync(self.async_client.post)('/api/products/async/products/', {})
+        self.assertEqual(response.status_code, 405)
+
+
+class ConnectionStatsTests(TransactionTestCase):
+    def setUp(self):
+        reset_stats()
+
+    def test_checkouts_are_counted(self):
+        def query():
+            Product.objects.count()
+            connection.close()
+
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+        out = StringIO()
+        call_command('db_connection_stats', reset=True, stdout=out)
+        self.assertIn('checkouts: 1 ', out.getvalue())
+        self.assertIn('connections (', out.getvalue())
+        self.assertEqual(checkout_stats()['checkouts'], 0)
+
+    def test_counters_are_visible_to_other_processes(self):
+        record_checkout(0.002)
+        flush()
+        # A fresh backend instance stands in for the command's own cache connection.
+        other = caches.create_connection(settings.DB_STATS_CACHE)
+        self.assertEqual(other.get_many(['db:stats:checkouts', 'db:stats:wait_us']),
+                         {'db:stats:checkouts': 1, 'db:stats:wait_us': 2000})
+
+    def test_benchmark_compares_connection_modes(self):
+        Product.objects.create(name='Pooled', price=1)
+        out = StringIO()
+        call_command('benchmark_db_connections', requests=6, concurrency=2, stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[2:]}
+        self.assertEqual(set(rows), {'none', 'persistent', 'pool'})
+        self.assertTrue(all(row[-1] == '0' for row in rows.values()))  # no errors
+        self.assertEqual(rows['none'][5], '6')  # a new connection per request
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (CategoryViewSet, ProductViewSet, ProductImageViewSet, 
                    FileManagerViewSet, CartViewSet, OrderViewSet, OrderItemViewSet, ReviewViewSet)
 
@@ -14,5 +15,9 @@ router.register(r'order-items', OrderItemViewSet, basename='orderitem')
 router.register(r'reviews', ReviewViewSet, basename='review') 
 
 urlpatterns = [
+    # Async read endpoints for ASGI deployments (see products.async_views).
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/categories/tree/', async_views.category_tree_view, name='async-category-tree'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,46 +1,152 @@
-from rest_framework import viewsets, status, filters as rest_filters
+from rest_framework import viewsets, status
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-from django.db import transaction
-from .models import Category, Product, ProductImage, FileManager, Cart, Order, OrderItem, Review
-from .serializers import (CategorySerializer, ProductSerializer, ProductImageSerializer, 
-                         FileManagerSerializer, CartSerializer, OrderSerializer, OrderItemSerializer, ReviewSerializer)
-from .filters import ProductFilter
-from django.db import models
+from django_filters.utils import translate_validation
+from .models import Category, Product, ProductImage, FileManager, UploadSession, Cart, Order, OrderItem, Review
+from .serializers import (CategorySerializer, ProductSerializer, ProductListSerializer, ProductImageSerializer, 
+                         FileManagerSerializer, CartSerializer, OrderSerializer, OrderItemSerializer, ReviewSerializer,
+                         UploadStartSerializer, UploadSessionSerializer)
+from .filters import ProductFilter, OrderExportFilter, UniqueOrderingFilter
+from .search import search_products
+from .checkout import checkout, CheckoutError
+from .reservations import reserve, release, ReservationError
+from .cache import CachedCatalogMixin
+from .conditional import ConditionalGetMixin
+from .facets import facet_counts
+from .importexport import (import_products, export_products, export_order_items, guess_format,
+                           ImportFormatError, FILE_FORMATS)
+from . import files
+from django.db import models, transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+# Prefetches the nested relations rendered by ProductSerializer so a listing runs a
+# fixed number of queries. `prefix` points at the product from another model (e.g. 'product__').
+def product_prefetches(user, prefix=''):
+    reviews = Review.objects.all() if user.is_staff else Review.objects.filter(is_approved=True)
+    return [
+        f'{prefix}images',
+        models.Prefetch(f'{prefix}reviews', queryset=reviews),
+    ]
+
+def streaming_export(lines, file_format, filename):
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(lines, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+# Active categories in tree order; inactive categories hide their subtree.
+def active_categories():
+    return Category.objects.filter(is_active=True).only('id', 'name', 'image', 'parent_id').order_by('path')
+
+def category_tree(categories, request):
+    nodes = {}
+    roots = []
+    for category in categories:
+        if category.parent_id and category.parent_id not in nodes:
+            continue
+        node = {
+            'id': category.id,
+            'name': category.name,
+            'image': request.build_absolute_uri(category.image.url) if category.image else None,
+            'children': [],
+        }
+        nodes[category.id] = node
+        (nodes[category.parent_id]['children'] if category.parent_id else roots).append(node)
+    return roots
+
+class CategoryViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.prefetch_related('children')
     serializer_class = CategorySerializer
+    cache_list_tags = ('categories',)
+    cache_detail_tags = ('categories',)
+
+    # A category renders links to its children.
+    def validator_queryset(self):
+        if self.action == 'retrieve':
+            pk = self.kwargs['pk']
+            return Category.objects.filter(models.Q(pk=pk) | models.Q(parent_id=pk))
+        return super().validator_queryset()
+
+    # Whole active category tree (inactive categories hide their subtree) from one query.
+    @action(detail=False)
+    def tree(self, request):
+        return self.conditional_response(self.cached_tree, request)
+
+    def cached_tree(self, request):
+        return self.cached_response(self.cache_list_tags, self.render_tree, request)
+
+    def render_tree(self, request):
+        return Response(category_tree(active_categories(), request))
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, UniqueOrderingFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'short_description', 'long_description']
+    ordering_fields = ['price', 'created_at', 'avg_rating', 'review_count']
+    cursor_ordering = '-created_at'
+    cache_list_tags = ('products',)
+    cache_detail_tags = ('product:{pk}',)
 
-    def get_queryset(self):
+    def get_search_queryset(self):
         queryset = Product.objects.all()
         search_query = self.request.query_params.get('search', None)
         if search_query:
-            query = SearchQuery(search_query)
-            vector = SearchVector('name', weight='A') + \
-                     SearchVector('short_description', weight='B') + \
-                     SearchVector('long_description', weight='C')
-            queryset = queryset.annotate(
-                rank=SearchRank(vector, query)
-            ).filter(rank__gte=0.1).order_by('-rank')
-
-        if not self.request.user.is_staff: 
-            queryset = queryset.prefetch_related(
-                models.Prefetch('reviews', queryset=Review.objects.filter(is_approved=True))
-            )
+            queryset = search_products(queryset, search_query)
         return queryset
 
+    def get_queryset(self):
+        queryset = self.get_search_queryset()
+        if self.action == 'list':
+            # The cursor column too, or building the next link reloads the last row.
+            return queryset.only(*ProductListSerializer.queryset_fields, self.cursor_ordering.lstrip('-'))
+        return queryset.prefetch_related(*product_prefetches(self.request.user))
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductListSerializer
+        return ProductSerializer
+
+    # Counts per brand/size/color/price bucket for the current filters and search,
+    # each facet ignoring its own filter (see products.facets).
+    @action(detail=False)
+    def facets(self, request):
+        return self.cached_response(self.cache_list_tags, self.render_facets, request)
+
+    # Invalid filter values get the same 400 as on the list endpoint.
+    def render_facets(self, request):
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.none())
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return Response(facet_counts(request.query_params, self.get_search_queryset()))
+
+    # Bulk upsert by sku from an uploaded CSV/JSONL `file` (see products.importexport).
+    # The format comes from `file_format` or the file extension; `format` is taken by DRF.
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "فایل ارسال نشده است"}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        try:
+            report = import_products(upload.file, file_format)
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict())
+
+    @action(detail=False, url_path='export', permission_classes=[IsAdminUser])
+    def bulk_export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FILE_FORMATS:
+            return Response({"error": f"فرمت {file_format} پشتیبانی نمی‌شود"}, status=status.HTTP_400_BAD_REQUEST)
+        return streaming_export(export_products(file_format), file_format, 'products')
+
 class ProductImageViewSet(viewsets.ModelViewSet):
     queryset = ProductImage.objects.all()
     serializer_class = ProductImageSerializer
@@ -49,66 +155,131 @@ class FileManagerViewSet(viewsets.ModelViewSet):
     queryset = FileManager.objects.all()
     serializer_class = FileManagerSerializer
 
+    # Range requests are answered with 206; with FILE_DOWNLOAD_MODE 'x-accel' or
+    # 'x-sendfile' the web server sends the bytes instead of this worker.
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        return files.download_response(request, self.get_object())
+
+    # Chunked upload: POST files/uploads/ with name, size (and optionally sha256),
+    # then PUT files/uploads/<id>/ each chunk in order as the raw request body with
+    # `Content-Range: bytes first-last/size`. GET returns the offset to resume from.
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        serializer = UploadStartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session, stored = files.start(**serializer.validated_data)
+        return Response(self.upload_state(session, stored), status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'put', 'delete'],
+            url_path=r'uploads/(?P<upload_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+    def upload(self, request, upload_id=None):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        if request.method == 'GET':
+            return Response(self.upload_state(session, None))
+        if request.method == 'DELETE':
+            files.abort(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        try:
+            session, stored = files.append(session.pk, request.headers.get('Content-Range'), request.stream, length)
+        except UploadSession.DoesNotExist:
+            raise NotFound()
+        except files.OffsetMismatch as e:
+            return Response({"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        except files.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.upload_state(session, stored), status=status.HTTP_201_CREATED if stored else status.HTTP_200_OK)
+
+    def upload_state(self, session, stored):
+        context = self.get_serializer_context()
+        return {
+            'complete': stored is not None,
+            'upload': UploadSessionSerializer(session).data if session else None,
+            'file': FileManagerSerializer(stored, context=context).data if stored else None,
+        }
+
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).select_related('product').prefetch_related(
+            *product_prefetches(self.request.user, 'product__')
+        )
 
+    # Every cart line holds its quantity for STOCK_RESERVATION_TTL (see products.reservations).
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            item = serializer.save(user=self.request.user)
+            self.hold_stock(item)
+
+    # Moving a line to another product releases the old product's hold.
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = serializer.instance.product
+            item = serializer.save()
+            if item.product_id != previous.pk:
+                release(self.request.user, previous)
+            self.hold_stock(item)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            release(self.request.user, instance.product)
+            instance.delete()
+
+    def hold_stock(self, item):
+        try:
+            reserve(self.request.user, item.product, item.quantity)
+        except ReservationError as e:
+            raise ValidationError({"error": str(e)})
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = '-created_at'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+            *product_prefetches(self.request.user, 'items__product__')
+        )
 
     def create(self, request, *args, **kwargs):
-        cart_items = Cart.objects.filter(user=request.user)
-        if not cart_items.exists():
-            return Response({"error": "سبد خرید خالی است"}, status=status.HTTP_400_BAD_REQUEST)
-
-        total_price = sum(item.product.price * item.quantity for item in cart_items)
+        try:
+            order = checkout(request.user, request.data.get('shipping_address', ''))
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            for item in cart_items:
-                if item.product.stock < item.quantity:
-                    return Response({"error": f"موجودی {item.product.name} کافی نیست"}, 
-                                  status=status.HTTP_400_BAD_REQUEST)
-
-            order = Order.objects.create(
-                user=request.user,
-                total_price=total_price,
-                shipping_address=request.data.get('shipping_address', '')
-            )
-
-            for item in cart_items:
-                product = item.product
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=item.quantity,
-                    price=product.price
-                )
-                product.stock -= item.quantity
-                product.save()
-
-            cart_items.delete()
-
-        serializer = self.get_serializer(order)
+        serializer = self.get_serializer(self.get_queryset().get(pk=order.pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    # One CSV/NDJSON row per order line, streamed from a server-side cursor. Staff
+    # export every user's orders; filters: date_from, date_to (YYYY-MM-DD), status.
+    @action(detail=False)
+    def export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FILE_FORMATS:
+            return Response({"error": f"فرمت {file_format} پشتیبانی نمی‌شود"}, status=status.HTTP_400_BAD_REQUEST)
+        items = OrderItem.objects.all()
+        if not request.user.is_staff:
+            items = items.filter(order__user=request.user)
+        filterset = OrderExportFilter(request.query_params, queryset=items)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        return streaming_export(export_order_items(file_format, filterset.qs), file_format, 'orders')
+
 class OrderItemViewSet(viewsets.ModelViewSet):
     serializer_class = OrderItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return OrderItem.objects.filter(order__user=self.request.user)
+        return OrderItem.objects.filter(order__user=self.request.user).select_related('product').prefetch_related(
+            *product_prefetches(self.request.user, 'product__')
+        )
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
 
@@ -119,5 +290,9 @@ class ReviewViewSet(viewsets.ModelViewSet):
             queryset = Review.objects.all()
         return queryset
 
+    # Non-staff users only list their own reviews.
+    def audience(self, request):
+        return 'staff' if request.user.is_staff else f'user:{request.user.pk}'
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
\ No newline at end of file
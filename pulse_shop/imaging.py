@@ -0,0 +1,41 @@
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# Pure Pillow code, run in the rendition worker processes (see pulse_shop.renditions).
+# It must not import Django: workers are spawned fresh and never call django.setup().
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+
+# Returns {(size, file_format): encoded bytes} for every size (name, bounding box)
+# and format. Images are only ever scaled down, keeping their aspect ratio.
+def render(data, sizes, formats, quality):
+    with Image.open(BytesIO(data)) as original:
+        # JPEGs decode straight at a reduced scale when the largest box allows it,
+        # which is most of the cost for multi-megapixel phone photos.
+        largest = max(box for _, box in sizes)
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    renditions = {}
+    # Largest first, so each size is resampled (in place) from the previous one.
+    for size, box in sorted(sizes, key=lambda item: item[1], reverse=True):
+        image.thumbnail((box, box), Image.Resampling.LANCZOS)
+        for file_format in formats:
+            renditions[size, file_format] = encode(image, file_format, quality)
+    return renditions
+
+
+def encode(image, file_format, quality):
+    if file_format == 'jpeg' and image.mode == 'RGBA':
+        flat = Image.new('RGB', image.size, 'white')
+        flat.paste(image, mask=image.getchannel('A'))
+        image = flat
+    buffer = BytesIO()
+    image.save(buffer, quality=quality, **SAVE_OPTIONS[file_format])
+    return buffer.getvalue()
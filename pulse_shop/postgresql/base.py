@@ -0,0 +1,18 @@
+import time
+from django.db.backends.postgresql import base
+from .stats import record_checkout
+
+
+# The stock PostgreSQL backend, timing every connection Django obtains: a pool
+# checkout (waiting for a free connection, or for a new one when the pool grows)
+# or, without a pool, a fresh connection.
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception:
+            record_checkout(time.perf_counter() - started, failed=True)
+            raise
+        record_checkout(time.perf_counter() - started)
+        return connection
@@ -0,0 +1,83 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import connection
+from django.dispatch import receiver
+
+# Connection checkout counters. Checkouts are counted per process and added to
+# counters in the DB_STATS_CACHE cache after a request, at most every
+# DB_STATS_FLUSH_INTERVAL seconds, never while a connection is being opened (a
+# database cache backend needs one). That cache is shared, so db_connection_stats
+# sees every process. Its increments are atomic on Redis or Memcached; the default
+# database cache reads and writes them, so racing flushes can drop a few counts.
+
+COUNTERS = ('checkouts', 'failures', 'wait_us')
+
+_lock = threading.Lock()
+_pending = dict.fromkeys(COUNTERS, 0)
+_flushed_at = 0.0
+
+
+def stats_cache():
+    return caches[settings.DB_STATS_CACHE]
+
+
+def record_checkout(seconds, failed=False):
+    with _lock:
+        _pending['failures' if failed else 'checkouts'] += 1
+        _pending['wait_us'] += int(seconds * 1_000_000)
+
+
+# The request's connection may already be released by now; one a database cache
+# opens for the flush is released again right after. Inside a transaction (e.g. a
+# test's) the flush waits: a database cache would hold the counter rows' locks
+# until it ends, and lose the counts if it rolls back.
+@receiver(request_finished, dispatch_uid='db-stats-flush')
+def flush_due(**kwargs):
+    if connection.in_atomic_block:
+        return
+    if time.monotonic() - _flushed_at >= settings.DB_STATS_FLUSH_INTERVAL:
+        opened = connection.connection is None
+        flush()
+        if opened:
+            connection.close()
+
+
+def flush():
+    global _flushed_at
+    with _lock:
+        pending = dict(_pending)
+        _pending.update(dict.fromkeys(COUNTERS, 0))
+        _flushed_at = time.monotonic()
+    cache = stats_cache()
+    for name, amount in pending.items():
+        if amount:
+            key = f'db:stats:{name}'
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                pass
+
+
+def checkout_stats():
+    flush()
+    counters = stats_cache().get_many([f'db:stats:{name}' for name in COUNTERS])
+    checkouts = counters.get('db:stats:checkouts', 0)
+    failures = counters.get('db:stats:failures', 0)
+    wait_ms = counters.get('db:stats:wait_us', 0) / 1000
+    return {
+        'checkouts': checkouts,
+        'failures': failures,
+        'wait_ms': wait_ms,
+        'avg_wait_ms': wait_ms / (checkouts + failures) if checkouts + failures else 0,
+    }
+
+
+# Drops this process's unflushed counts too (e.g. the checkout the delete needed).
+def reset_stats():
+    stats_cache().delete_many([f'db:stats:{name}' for name in COUNTERS])
+    with _lock:
+        _pending.update(dict.fromkeys(COUNTERS, 0))
@@ -0,0 +1,181 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import Signal
+from rest_framework import serializers
+from . import imaging
+
+
+# Uploaded images get downscaled renditions (IMAGE_RENDITION_SIZES, in every
+# IMAGE_RENDITION_FORMATS) stored next to the original under deterministic names
+# that keep its extension, e.g. product_images/shoe.jpg ->
+# product_images/shoe.jpg.list.webp (so shoe.png can't collide with it), and
+# serializers build their URLs from the original's name without touching the DB.
+# Resizing runs after commit in a pool of IMAGE_RENDITION_WORKERS processes (0 =
+# inline); the generate_renditions command backfills existing media. Apps list
+# their image fields with `register` (see products.renditions, accounts.renditions).
+
+IMAGE_FIELDS = {}
+
+# Sent with the original's `name` once all of its renditions are stored, in the
+# process that stored them. Rows showing the image render differently from then
+# on (see RenditionsField), so apps refresh their validators and caches.
+rendered = Signal()
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_pool = None
+
+
+def register(model, *fields):
+    IMAGE_FIELDS[model] = list(fields)
+    pre_save.connect(remember_uploads, sender=model, dispatch_uid=f'renditions-pre-{model.__name__}')
+    post_save.connect(schedule_renditions, sender=model, dispatch_uid=f'renditions-post-{model.__name__}')
+
+
+def rendition_name(name, size, file_format):
+    return f'{name}.{size}.{EXTENSIONS[file_format]}'
+
+
+def rendition_names(name):
+    return [rendition_name(name, size, file_format)
+            for size in settings.IMAGE_RENDITION_SIZES for file_format in settings.IMAGE_RENDITION_FORMATS]
+
+
+def has_renditions(name):
+    return all(default_storage.exists(rendition) for rendition in rendition_names(name))
+
+
+def render_args(name):
+    with default_storage.open(name, 'rb') as original:
+        data = original.read()
+    return data, list(settings.IMAGE_RENDITION_SIZES.items()), list(settings.IMAGE_RENDITION_FORMATS), settings.IMAGE_RENDITION_QUALITY
+
+
+# Written in rendition_names() order, so once the last one exists all of them do.
+def store(name, renditions):
+    for size in settings.IMAGE_RENDITION_SIZES:
+        for file_format in settings.IMAGE_RENDITION_FORMATS:
+            target = rendition_name(name, size, file_format)
+            default_storage.delete(target)
+            default_storage.save(target, ContentFile(renditions[size, file_format]))
+    rendered.send(sender=None, name=name)
+
+
+def is_rendered(name):
+    return default_storage.exists(rendition_names(name)[-1])
+
+
+# Workers are spawned (not forked) so they never inherit the web process's
+# threads, locks or database connections.
+def process_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = process_pool(settings.IMAGE_RENDITION_WORKERS)
+    return _pool
+
+
+def generate(name):
+    store(name, imaging.render(*render_args(name)))
+
+
+# Fire and forget: the request that uploaded the image doesn't wait for resizing.
+# A rendition that fails here is picked up by the next generate_renditions run.
+def schedule(names):
+    for name in names:
+        if not settings.IMAGE_RENDITION_WORKERS:
+            generate(name)
+            continue
+        pool().submit(imaging.render, *render_args(name)).add_done_callback(stored(name))
+
+
+# Runs on the pool's result thread, which keeps no database connection open.
+def stored(name):
+    def callback(future):
+        if future.exception() is None:
+            try:
+                store(name, future.result())
+            finally:
+                connections.close_all()
+    return callback
+
+
+def stored_images():
+    for model, fields in IMAGE_FIELDS.items():
+        for field in fields:
+            images = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            yield from images.order_by().values_list(field, flat=True).distinct().iterator()
+
+
+# Renders every stored image that lacks renditions (all of them with force) on
+# `workers` processes, keeping only a couple of originals per worker in memory.
+# Returns (generated, failed); missing or unreadable originals count as failed.
+def backfill(workers, force=False):
+    generated = failed = 0
+    names = (name for name in stored_images() if force or not has_renditions(name))
+
+    def collect(name, future):
+        nonlocal generated, failed
+        try:
+            store(name, future.result())
+            generated += 1
+        except Exception:
+            failed += 1
+
+    with process_pool(workers) as executor:
+        running = {}
+        for name in names:
+            if len(running) >= workers * 2:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(running.pop(future), future)
+            try:
+                running[executor.submit(imaging.render, *render_args(name))] = name
+            except OSError:
+                failed += 1
+        for future, name in running.items():
+            collect(name, future)
+    return generated, failed
+
+
+# Only fresh uploads (not yet committed to storage) get renditions; saving a
+# model that just keeps its image doesn't resize it again.
+def remember_uploads(sender, instance, **kwargs):
+    instance._new_images = [field for field in IMAGE_FIELDS[sender]
+                            if getattr(instance, field) and not getattr(instance, field)._committed]
+
+
+def schedule_renditions(sender, instance, **kwargs):
+    fields = instance.__dict__.pop('_new_images', None)
+    if fields:
+        names = [getattr(instance, field).name for field in fields]
+        transaction.on_commit(lambda: schedule(names), robust=True)
+
+
+# {size: {format: url}} for an image field, or None when it's empty or its
+# renditions haven't been stored yet (clients then fall back to the original).
+# That costs one storage existence check per image.
+class RenditionsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, image):
+        if not image or not is_rendered(image.name):
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for size in settings.IMAGE_RENDITION_SIZES:
+            urls[size] = {}
+            for file_format in settings.IMAGE_RENDITION_FORMATS:
+                url = default_storage.url(rendition_name(image.name, size, file_format))
+                urls[size][file_format] = request.build_absolute_uri(url) if request else url
+        return urls
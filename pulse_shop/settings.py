@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
+from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,12 +49,28 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'accounts.authentication.ThrottledBasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'products.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+    # Token buckets of accounts.throttling: capacity per period, refilled evenly.
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_username': '5/min',
+        'two_factor_ip': '20/min',
+        'two_factor': '5/min',
+        'password_reset_ip': '5/min',
+        'password_reset_email': '3/hour',
+    },
+    # Reverse proxies in front of the app. Throttles key on the client address
+    # they append to X-Forwarded-For; with 0 the header is ignored and REMOTE_ADDR
+    # is used, so clients can't pick their own throttle bucket.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 MIDDLEWARE = [
@@ -87,20 +106,93 @@ WSGI_APPLICATION = 'pulse_shop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are sized per worker process from the environment. With DB_POOL=1
+# (the default, when psycopg_pool is installed) each process shares a psycopg pool
+# of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections between its threads, and a
+# request waits at most DB_POOL_TIMEOUT seconds for a free one: size it to the
+# threads per process and keep DB_POOL_MAX_SIZE x processes below PostgreSQL's
+# max_connections. DB_POOL=0 keeps one connection per thread for DB_CONN_MAX_AGE
+# seconds (0 = a new connection per request); under ASGI, whose sync code runs on
+# short-lived threads, use the pool instead. DB_CONN_HEALTH_CHECKS tests a
+# connection before it is reused. The engine is the stock backend plus checkout
+# counters (see pulse_shop.postgresql.stats).
+DB_POOL = bool(int(os.environ.get('DB_POOL', 1))) and bool(find_spec('psycopg_pool'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'pulse_shop.postgresql',
         'NAME': 'pulse_shop_db',
         'USER': 'postgres',
         'PASSWORD': 'your_database_pass',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': bool(int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))),
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
     }
 }
+# Connection checkout counters (pulse_shop.postgresql.stats), flushed by every
+# process into this cache so db_connection_stats sees them all.
+DB_STATS_CACHE = os.environ.get('DB_STATS_CACHE', 'shared')
+DB_STATS_FLUSH_INTERVAL = 1
+
+# Cache
+# The catalog response cache defaults to local memory; point CATALOG_CACHE_BACKEND /
+# CATALOG_CACHE_LOCATION at a shared backend (e.g. django.core.cache.backends.redis.RedisCache
+# and redis://127.0.0.1:6379/1) in production.
+# 'shared' holds state every process must agree on (token revocations, pending
+# 2FA logins); it defaults to a database table (created by the accounts
+# migrations) so it works across workers out of the box. SHARED_CACHE_BACKEND /
+# SHARED_CACHE_LOCATION move it to e.g. Redis, which saves the query per lookup.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': os.environ.get('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'catalog'),
+    },
+    'shared': {
+        'BACKEND': os.environ.get('SHARED_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'shared_cache'),
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 60
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# New hashes use Argon2 when argon2-cffi is installed, scrypt otherwise; older
+# hashes (PBKDF2, or different cost parameters) are upgraded at the next login.
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunedArgon2PasswordHasher',
+    'accounts.hashers.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if not find_spec('argon2'):
+    PASSWORD_HASHERS.remove('accounts.hashers.TunedArgon2PasswordHasher')
+# Costs per hash (OWASP minimums): Argon2id 19 MiB / 2 passes, scrypt 32 MiB.
+PASSWORD_ARGON2_PARAMS = {
+    'time_cost': int(os.environ.get('ARGON2_TIME_COST', 2)),
+    'memory_cost': int(os.environ.get('ARGON2_MEMORY_COST', 19456)),
+    'parallelism': int(os.environ.get('ARGON2_PARALLELISM', 1)),
+}
+PASSWORD_SCRYPT_PARAMS = {
+    'work_factor': int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 15)),
+    'block_size': 8,
+    'parallelism': int(os.environ.get('SCRYPT_PARALLELISM', 3)),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -145,6 +237,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Image renditions (pulse_shop.renditions): longest side in pixels per size, output
+# formats, encoder quality and resizing processes (0 = resize inline after commit).
+IMAGE_RENDITION_SIZES = {'thumb': 160, 'list': 480, 'detail': 1200}
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_RENDITION_WORKERS = int(os.environ.get('IMAGE_RENDITION_WORKERS', 2))
+
+# FileManager uploads (products.files): limits of chunked uploads, and how downloads
+# are sent: 'django' streams them from the worker, 'x-accel' (nginx) and 'x-sendfile'
+# (Apache/lighttpd) hand the file to the web server. For nginx, map the internal
+# location FILE_DOWNLOAD_ACCEL_PREFIX to MEDIA_ROOT.
+FILE_UPLOAD_MAX_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_SIZE', 5 * 1024 ** 3))
+FILE_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+FILE_UPLOAD_SESSION_TTL = timedelta(days=1)
+FILE_UPLOAD_CHUNK_LEASE = timedelta(minutes=10)
+FILE_DOWNLOAD_MODE = os.environ.get('FILE_DOWNLOAD_MODE', 'django')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
 # Custom user model
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
@@ -156,4 +266,49 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'Ypour email address' 
 EMAIL_HOST_PASSWORD = 'Your app password'
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = 10
+
+# Email outbox (accounts.outbox): in-process delivery threads (0 = only the
+# send_queued_mail command delivers), messages per SMTP connection, and retries
+# with exponential backoff (seconds). A claimed batch is skipped by other workers
+# for EMAIL_OUTBOX_LEASE seconds, longer than a full batch of SMTP timeouts.
+EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', 2))
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+EMAIL_OUTBOX_LEASE = 900
+
+
+# Stock reservations (cart holds)
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+# Signed API tokens (accounts.tokens). The refresh token revocation list lives in
+# this cache, which every process must share; accounts.checks rejects a local-memory
+# one. Access tokens aren't checked against it, so TOKEN_ACCESS_TTL bounds how long
+# a revoked session keeps working.
+TOKEN_ACCESS_TTL = timedelta(minutes=5)
+TOKEN_REFRESH_TTL = timedelta(days=7)
+TOKEN_REVOCATION_CACHE = os.environ.get('TOKEN_REVOCATION_CACHE', 'shared')
+
+# Sessions live in the database by default. 'accounts.sessions' (cached_db with a
+# per-process LRU in front of the cache) is opt-in: it needs SESSION_CACHE_ALIAS on
+# a shared backend, which accounts.checks enforces, and may serve a session for up
+# to SESSION_LOCAL_CACHE_TTL seconds after another process logged it out. Other
+# engines (e.g. 'django.contrib.sessions.backends.cache' or
+# 'django.contrib.sessions.backends.signed_cookies') can be chosen per deployment.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+SESSION_CACHE_ALIAS = os.environ.get('SESSION_CACHE_ALIAS', 'default')
+SESSION_LOCAL_CACHE_SIZE = 10000
+SESSION_LOCAL_CACHE_TTL = 5
+
+# Logins waiting for their 2FA code (accounts.pending); the verify request may
+# reach another process than the login, so the cache must be shared.
+PENDING_LOGIN_CACHE = os.environ.get('PENDING_LOGIN_CACHE', 'shared')
+PENDING_LOGIN_TTL = timedelta(minutes=10)
+
+# Throttle buckets and verified Basic auth credentials. Shared, or N processes
+# would allow N times the configured rates; accounts.checks rejects a local-memory one.
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'shared')
+BASIC_AUTH_CACHE_TTL = 300